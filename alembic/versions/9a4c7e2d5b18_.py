@@ -0,0 +1,226 @@
+"""number finishes and races with counters
+
+Revision ID: 9a4c7e2d5b18
+Revises: f3c19a5e8b27
+Create Date: 2026-10-18 17:46:52.117390
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "9a4c7e2d5b18"
+down_revision = "f3c19a5e8b27"
+branch_labels = None
+depends_on = None
+
+# drop repeated finishes of a boat in a race, keeping the first one
+DELETE_REPEATED_FINISHES = """
+    DELETE FROM position
+    USING (
+        SELECT id,
+               ROW_NUMBER() OVER (
+                   PARTITION BY race_id, sail_nr ORDER BY points, created_at
+               ) AS occurrence
+        FROM position
+    ) AS finishes
+    WHERE position.id = finishes.id AND finishes.occurrence > 1
+    RETURNING position.race_id
+"""
+# renumber the finishes of races with places given twice, in the order given
+RENUMBER_FINISHES = """
+    UPDATE position
+    SET points = finishes.place
+    FROM (
+        SELECT id,
+               ROW_NUMBER() OVER (
+                   PARTITION BY race_id ORDER BY points, created_at
+               ) AS place
+        FROM position
+        WHERE race_id IN (
+            SELECT race_id FROM position GROUP BY race_id, points HAVING count(*) > 1
+        )
+    ) AS finishes
+    WHERE position.id = finishes.id
+    RETURNING position.race_id
+"""
+# renumber the races of competitions with numbers given twice, in the order given
+RENUMBER_RACES = """
+    UPDATE race
+    SET race_nr = races.race_nr
+    FROM (
+        SELECT id,
+               ROW_NUMBER() OVER (
+                   PARTITION BY competition_id ORDER BY race_nr, created_at
+               ) AS race_nr
+        FROM race
+        WHERE competition_id IN (
+            SELECT competition_id
+            FROM race
+            GROUP BY competition_id, race_nr
+            HAVING count(*) > 1
+        )
+    ) AS races
+    WHERE race.id = races.id
+"""
+# the statements of api.services.scoring and api.services.leaderboard at the time
+RESCORE_COMPETITION = """
+    WITH discards AS (
+        SELECT count(*) / :races_per_discard AS discards
+        FROM race
+        WHERE race.competition_id = :competition_id
+    ),
+    ranked AS (
+        SELECT position.sail_nr,
+               position.points,
+               ROW_NUMBER() OVER (
+                   PARTITION BY position.sail_nr ORDER BY position.points DESC
+               ) AS worst
+        FROM position
+        JOIN race ON race.id = position.race_id
+        WHERE race.competition_id = :competition_id
+    ),
+    scores AS (
+        SELECT competitor.id AS competitor_id,
+               coalesce(sum(ranked.points), 0) AS total,
+               coalesce(sum(ranked.points) FILTER (WHERE worst <= discards), 0)
+                   AS discarded_total,
+               coalesce(
+                   array_agg(ranked.points ORDER BY ranked.points)
+                       FILTER (WHERE worst <= discards),
+                   '{}'
+               ) AS discarded
+        FROM competitor
+        CROSS JOIN discards
+        LEFT JOIN ranked ON ranked.sail_nr = competitor.sail_nr
+        WHERE competitor.competition_id = :competition_id
+        GROUP BY competitor.id
+    )
+    UPDATE competitor
+    SET total_points = scores.total,
+        net_points = scores.total - scores.discarded_total,
+        discarded_points = scores.discarded
+    FROM scores
+    WHERE competitor.id = scores.competitor_id
+"""
+DELETE_STANDINGS = "DELETE FROM standing WHERE competition_id = :competition_id"
+INSERT_STANDINGS = """
+    WITH results AS (
+        SELECT competitor.id AS competitor_id,
+               competitor.total_points,
+               competitor.net_points,
+               count(position.points) AS finishes,
+               coalesce(
+                   array_agg(position.points ORDER BY race.race_nr)
+                       FILTER (WHERE race.id IS NOT NULL),
+                   '{}'
+               ) AS race_points,
+               coalesce(
+                   array_agg(position.points ORDER BY position.points)
+                       FILTER (WHERE position.points IS NOT NULL),
+                   '{}'
+               ) AS sorted_points,
+               array_agg(position.points ORDER BY race.race_nr DESC) AS latest_points,
+               cardinality(competitor.discarded_points) AS discards
+        FROM competitor
+        LEFT JOIN race ON race.competition_id = competitor.competition_id
+        LEFT JOIN position
+          ON position.race_id = race.id AND position.sail_nr = competitor.sail_nr
+        WHERE competitor.competition_id = :competition_id
+        GROUP BY competitor.id
+    )
+    INSERT INTO standing (
+        id,
+        competition_id,
+        competitor_id,
+        rank,
+        total_points,
+        net_points,
+        race_points
+    )
+    SELECT gen_random_uuid(),
+           :competition_id,
+           competitor_id,
+           RANK() OVER (
+               ORDER BY finishes = 0,
+                        net_points,
+                        sorted_points[1:finishes - discards],
+                        latest_points
+           ),
+           total_points,
+           net_points,
+           race_points
+    FROM results
+"""
+
+
+def upgrade() -> None:
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.add_column(
+        "competition",
+        sa.Column("race_count", sa.BigInteger(), server_default="0", nullable=False),
+    )
+    op.add_column(
+        "race",
+        sa.Column("finish_count", sa.BigInteger(), server_default="0", nullable=False),
+    )
+    # ### end Alembic commands ###
+    connection = op.get_bind()
+
+    # finishes and races numbered twice by concurrent uploads are renumbered
+    races = {
+        row.race_id for row in connection.execute(sa.text(DELETE_REPEATED_FINISHES))
+    }
+    races |= {row.race_id for row in connection.execute(sa.text(RENUMBER_FINISHES))}
+    connection.execute(sa.text(RENUMBER_RACES))
+
+    op.execute(
+        """
+        UPDATE race
+        SET finish_count = coalesce(
+            (SELECT max(points) FROM position WHERE position.race_id = race.id), 0
+        )
+        """
+    )
+    op.execute(
+        """
+        UPDATE competition
+        SET race_count = coalesce(
+            (SELECT max(race_nr) FROM race WHERE race.competition_id = competition.id),
+            0
+        )
+        """
+    )
+
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.create_unique_constraint(
+        "_race_id_sail_nr_uc", "position", ["race_id", "sail_nr"]
+    )
+    op.create_unique_constraint("_race_id_points_uc", "position", ["race_id", "points"])
+    op.create_unique_constraint(
+        "_competition_id_race_nr_uc", "race", ["competition_id", "race_nr"]
+    )
+    # ### end Alembic commands ###
+
+    # the competitions with renumbered finishes are scored again
+    if races:
+        competitions = connection.execute(
+            sa.text("SELECT DISTINCT competition_id FROM race WHERE id = ANY(:races)"),
+            {"races": list(races)},
+        )
+        for (competition_id,) in competitions.fetchall():
+            parameters = {"competition_id": competition_id, "races_per_discard": 4}
+            connection.execute(sa.text(RESCORE_COMPETITION), parameters)
+            connection.execute(sa.text(DELETE_STANDINGS), parameters)
+            connection.execute(sa.text(INSERT_STANDINGS), parameters)
+
+
+def downgrade() -> None:
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.drop_constraint("_competition_id_race_nr_uc", "race", type_="unique")
+    op.drop_constraint("_race_id_points_uc", "position", type_="unique")
+    op.drop_constraint("_race_id_sail_nr_uc", "position", type_="unique")
+    op.drop_column("race", "finish_count")
+    op.drop_column("competition", "race_count")
+    # ### end Alembic commands ###
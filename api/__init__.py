@@ -1,17 +1,44 @@
+import asyncio
 import logging
+import threading
 
-import tensorflow as tf
-from fastapi import FastAPI, status
+from fastapi import FastAPI, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
-from . import config, database, models, routes, schemas
+from . import config, database, metrics, models, routes, schemas
+from .admission import AdmissionMiddleware
+from .capture import CaptureMiddleware
 from .config import settings
 from .database import Base, get_db
-
-model = tf.keras.models.load_model("api/ai/cnn_model")
+from .inference import ModelProvider, create_backend
+from .profiling import ProfileMiddleware
+
+# the recognizers of sail numbers by name
+RECOGNIZERS = ("digits", "crnn")
+if settings.recognizer not in RECOGNIZERS:
+    raise ValueError(f"unknown recognizer {settings.recognizer}")
+
+model_provider = ModelProvider(create_backend(settings.inference_backend))
+sequence_provider = ModelProvider(
+    create_backend(settings.inference_backend, settings.crnn_model_path),
+    input_shape=(32, 128),
+)
+# the model of the configured recognizer, warmed up on startup
+recognizer_provider = (
+    sequence_provider if settings.recognizer == "crnn" else model_provider
+)
 
 app = FastAPI()
 logger = logging.getLogger("uvicorn.error")
+# set to stop the job workers running inside the api process
+stop_workers = threading.Event()
+
+
+def log_model_failure(future: asyncio.Future):
+    """Log the error of loading or warming up the model in the background."""
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("loading the model failed", exc_info=future.exception())
 
 
 def create_app():
@@ -19,12 +46,24 @@ def create_app():
 
     origins = ["*"]
 
+    # added first so rejected requests still get the cors headers
+    app.add_middleware(AdmissionMiddleware)
     app.add_middleware(
         CORSMiddleware,
         allow_origins=origins,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["Retry-After", "X-Profile-Id"],
     )
+    if settings.admin_token:
+        app.add_middleware(
+            ProfileMiddleware,
+            token=settings.admin_token,
+            directory=settings.profile_directory,
+        )
+    if settings.capture_directory:
+        # outermost, so the capture includes rejected requests and all middleware
+        app.add_middleware(CaptureMiddleware, directory=settings.capture_directory)
 
     from api.routes import competition
 
@@ -50,8 +89,50 @@ def create_app():
 
     app.include_router(club.router)
 
+    @app.on_event("startup")
+    async def warm_up_model():
+        # load in the background so the health check answers meanwhile, the
+        # readiness check turns ready once the model is warmed up, or loaded
+        # without a warm-up
+        prepare = (
+            recognizer_provider.warm_up
+            if settings.model_warm_up
+            else recognizer_provider.get
+        )
+        future = asyncio.get_running_loop().run_in_executor(None, prepare)
+        future.add_done_callback(log_model_failure)
+
+    @app.on_event("startup")
+    def start_job_workers():
+        from api.services import start_workers
+
+        start_workers(settings.job_workers, stop_workers)
+
+    @app.on_event("shutdown")
+    def stop_job_workers():
+        stop_workers.set()
+
     @app.get("/health-check", status_code=status.HTTP_200_OK)
     def health_check() -> dict[str, bool]:
         return {"healthy": True}
 
+    @app.get("/metrics", response_class=PlainTextResponse)
+    def get_metrics():
+        return PlainTextResponse(
+            metrics.render(), media_type="text/plain; version=0.0.4"
+        )
+
+    @app.get("/ready", status_code=status.HTTP_200_OK)
+    def ready(response: Response) -> dict:
+        if not recognizer_provider.ready:
+            response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+
+        return {
+            "ready": recognizer_provider.ready,
+            "recognizer": settings.recognizer,
+            "model_load_seconds": recognizer_provider.load_seconds,
+            "model_warmup_seconds": recognizer_provider.warmup_seconds,
+            "first_predict_seconds": recognizer_provider.first_predict_seconds,
+        }
+
     return app
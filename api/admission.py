@@ -0,0 +1,244 @@
+"""Admission control of the expensive endpoints.
+
+Requests to the upload and recognition endpoints pass an admission queue
+before their body is read. Each queue handles a bounded number of requests at
+once, lets a bounded number wait for their turn and limits the requests of a
+single client, everything beyond that is answered right away with a ``429``
+and a ``Retry-After`` estimated from the recent service times.
+"""
+import asyncio
+import collections
+import contextlib
+import math
+import time
+from typing import Deque, Dict, Optional, Tuple
+
+from api.config import settings
+from api.metrics import Counter, Gauge
+
+# reasons requests are rejected for
+QUEUE_FULL = "queue_full"
+CLIENT_LIMIT = "client_limit"
+JOB_BACKLOG = "job_backlog"
+
+# weight of the latest request in the moving average of the service time
+SERVICE_TIME_WEIGHT = 0.2
+
+
+class Overloaded(Exception):
+    """Raised when a request is not admitted."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionQueue:
+    """Bound the concurrent requests to a group of endpoints.
+
+    At most ``concurrency`` requests are handled at once and at most ``depth``
+    more wait for their turn in arrival order. A client may have at most
+    ``per_client`` requests handled or waiting. State is kept per process, the
+    event loop is the only one changing it, so it needs no locks.
+    """
+
+    def __init__(self, name: str, concurrency: int, depth: int, per_client: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.depth = depth
+        self.per_client = per_client
+        self.active = 0
+
+        self._waiters: Deque[asyncio.Future] = collections.deque()
+        self._clients: Dict[str, int] = collections.Counter()
+        self._service_seconds: Optional[float] = None
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """Return the seconds after which a rejected request likely is admitted."""
+        seconds = self._service_seconds or 1.0
+        return max(1, math.ceil(seconds * (self.waiting + 1) / self.concurrency))
+
+    def check(self, client: str):
+        """Raise ``Overloaded`` if a request of the client would not be admitted."""
+        if self.per_client and self._clients[client] >= self.per_client:
+            raise Overloaded(CLIENT_LIMIT, self.retry_after())
+        if self.active >= self.concurrency and self.waiting >= self.depth:
+            raise Overloaded(QUEUE_FULL, self.retry_after())
+
+    @contextlib.asynccontextmanager
+    async def admit(self, client: str):
+        """Hold a slot of the queue while handling a request of the client."""
+        self.check(client)
+
+        self._clients[client] += 1
+        try:
+            if self.active >= self.concurrency or self._waiters:
+                waiter = asyncio.get_running_loop().create_future()
+                self._waiters.append(waiter)
+                try:
+                    await waiter
+                except BaseException:
+                    # pass the slot on if it was handed over while cancelled
+                    if waiter.done() and not waiter.cancelled():
+                        self._release()
+                    else:
+                        self._waiters.remove(waiter)
+                    raise
+            else:
+                self.active += 1
+
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                self._observe(time.perf_counter() - start)
+                self._release()
+        finally:
+            self._clients[client] -= 1
+            if not self._clients[client]:
+                del self._clients[client]
+
+    def _release(self):
+        # hand the slot straight to the next waiter, so the count stays the same
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def _observe(self, seconds: float):
+        if self._service_seconds is None:
+            self._service_seconds = seconds
+        else:
+            self._service_seconds += SERVICE_TIME_WEIGHT * (
+                seconds - self._service_seconds
+            )
+
+
+upload_queue = AdmissionQueue(
+    "upload",
+    concurrency=settings.admission_upload_concurrency,
+    depth=settings.admission_upload_depth,
+    per_client=settings.admission_per_client,
+)
+recognize_queue = AdmissionQueue(
+    "recognize",
+    concurrency=settings.admission_recognize_concurrency,
+    depth=settings.admission_recognize_depth,
+    per_client=settings.admission_per_client,
+)
+
+# the admission queue of the guarded endpoints by method and path
+QUEUES: Dict[Tuple[str, str], AdmissionQueue] = {
+    ("POST", "/positions/"): upload_queue,
+    ("POST", "/positions/video"): upload_queue,
+    ("POST", "/positions/archive"): upload_queue,
+    ("POST", "/positions/recognize"): recognize_queue,
+}
+
+admission_active = Gauge(
+    "admission_active_requests",
+    "Number of requests being handled by admission queue.",
+    ("queue",),
+    function=lambda: {queue.name: queue.active for queue in QUEUES.values()},
+)
+admission_waiting = Gauge(
+    "admission_waiting_requests",
+    "Number of requests waiting to be handled by admission queue.",
+    ("queue",),
+    function=lambda: {queue.name: queue.waiting for queue in QUEUES.values()},
+)
+admission_rejected = Counter(
+    "admission_rejected_total",
+    "Number of requests rejected by admission queue and reason.",
+    ("queue", "reason"),
+)
+
+
+class JobBacklog:
+    """Keep the number of queued upload jobs, counted at most once a second."""
+
+    def __init__(self, max_age: float = 1.0):
+        self.max_age = max_age
+        self._count = 0
+        self._counted_at = -math.inf
+
+    async def count(self) -> int:
+        if time.monotonic() - self._counted_at > self.max_age:
+            from api.services.jobs import count_backlog
+
+            # the requests arriving meanwhile get the previous count
+            self._counted_at = time.monotonic()
+            # not in the worker pool, where it would wait behind the recognitions
+            # it is there to shed
+            self._count = (await asyncio.to_thread(count_backlog))["QUEUED"]
+
+        return self._count
+
+
+job_backlog = JobBacklog()
+
+
+def get_client(scope) -> str:
+    """Return the address of the client of a request."""
+    if settings.admission_trust_forwarded:
+        for name, value in scope.get("headers", ()):
+            if name == b"x-forwarded-for":
+                return value.decode("latin-1").split(",")[0].strip()
+
+    client = scope.get("client")
+    return client[0] if client else ""
+
+
+class AdmissionMiddleware:
+    """Pass the requests to the guarded endpoints through their admission queue."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        queue = None
+        if scope["type"] == "http":
+            queue = QUEUES.get((scope["method"], scope["path"]))
+        if queue is None:
+            await self.app(scope, receive, send)
+            return
+
+        client = get_client(scope)
+        try:
+            queue.check(client)
+            if (
+                queue is upload_queue
+                and settings.admission_max_job_backlog
+                and await job_backlog.count() >= settings.admission_max_job_backlog
+            ):
+                raise Overloaded(JOB_BACKLOG, settings.admission_backlog_retry_after)
+
+            async with queue.admit(client):
+                await self.app(scope, receive, send)
+        except Overloaded as e:
+            admission_rejected.inc(queue.name, e.reason)
+            await reject(send, e)
+
+
+async def reject(send, overloaded: Overloaded):
+    """Answer a request that was not admitted with 429 and when to retry."""
+    body = b'{"detail":"too many requests, retry later"}'
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(overloaded.retry_after).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,19 @@
+import hmac
+from typing import Optional
+
+from fastapi import Header, HTTPException, status
+
+from api.config import settings
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Reject requests without the configured admin token in ``X-Admin-Token``.
+
+    Admin endpoints are disabled while no token is configured.
+    """
+    if not settings.admin_token or not hmac.compare_digest(
+        (x_admin_token or "").encode(), settings.admin_token.encode()
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="admin token required"
+        )
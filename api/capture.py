@@ -0,0 +1,133 @@
+"""Opt-in capture of the served traffic for replaying it with ``benchmarks.replay``.
+
+Every request is logged as a json line with its start time, route, status,
+duration and sizes. Request bodies are stored once per content under their
+sha256 in the ``payloads`` directory next to the logs and referenced from the
+log lines, so a replay can resend them byte for byte.
+"""
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import List, Optional
+
+from api.config import settings
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class CaptureWriter:
+    """Write the captured requests and payloads from a background thread, so
+    the event loop never waits for the disk."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = os.path.join(
+            directory, f"capture-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl"
+        )
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def write(self, record: dict, payload: Optional[bytes] = None):
+        with self._lock:
+            if self._thread is None:
+                os.makedirs(os.path.join(self.directory, "payloads"), exist_ok=True)
+                self._thread = threading.Thread(
+                    target=self._run, name="capture-writer", daemon=True
+                )
+                self._thread.start()
+
+        self._queue.put((record, payload))
+
+    def _run(self):
+        with open(self.path, "a", buffering=1) as log:
+            while True:
+                record, payload = self._queue.get()
+                try:
+                    if payload is not None:
+                        record["payload"] = hashlib.sha256(payload).hexdigest()
+                        self._store(record["payload"], payload)
+                    log.write(json.dumps(record) + "\n")
+                except OSError:
+                    logger.exception("capturing a request failed")
+
+    def _store(self, digest: str, payload: bytes):
+        path = os.path.join(self.directory, "payloads", digest)
+        if not os.path.exists(path):
+            with open(f"{path}.tmp", "wb") as payload_file:
+                payload_file.write(payload)
+            os.replace(f"{path}.tmp", path)
+
+
+class CaptureMiddleware:
+    """Capture the http requests passing through the app."""
+
+    def __init__(self, app, directory: str):
+        self.app = app
+        self.writer = CaptureWriter(directory)
+        # requests are logged relative to the first one
+        self._started: Optional[float] = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.time()
+        if self._started is None:
+            self._started = start
+        perf_start = time.perf_counter()
+
+        chunks: List[bytes] = []
+        request_bytes = 0
+        response_bytes = 0
+        status = None
+
+        async def capture_receive():
+            nonlocal request_bytes
+            message = await receive()
+            if message["type"] == "http.request":
+                body = message.get("body", b"")
+                request_bytes += len(body)
+                # bodies over the limit are measured but not kept
+                if request_bytes <= settings.capture_max_payload_bytes:
+                    chunks.append(body)
+            return message
+
+        async def capture_send(message):
+            nonlocal response_bytes, status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, capture_receive, capture_send)
+        finally:
+            payload = None
+            if request_bytes and request_bytes <= settings.capture_max_payload_bytes:
+                payload = b"".join(chunks)
+
+            headers = dict(scope.get("headers", ()))
+            route = scope.get("route")
+            record = {
+                "offset": start - self._started,
+                "timestamp": start,
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scope.get("query_string", b"").decode("latin-1"),
+                "route": getattr(route, "path", None),
+                "status": status,
+                "duration_ms": (time.perf_counter() - perf_start) * 1000,
+                "request_bytes": request_bytes,
+                "response_bytes": response_bytes,
+                "content_type": headers.get(b"content-type", b"").decode("latin-1"),
+                # set to the sha256 of the body once it is stored
+                "payload": None,
+            }
+            self.writer.write(record, payload)
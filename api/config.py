@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic import BaseSettings
 
 
@@ -7,6 +9,14 @@ class Settings(BaseSettings):
     # app settings
     fastapi_app: str
     fastapi_port: int
+    # number of pre-forked api processes, 1 serves from a single process
+    server_workers: int = 1
+    # requests after which a worker is replaced to limit leaks, 0 never replaces it
+    server_max_requests: int = 0
+    # seconds stopping workers may finish their requests before they are killed
+    server_graceful_timeout: int = 30
+    # seconds between logging the memory of the workers, 0 disables it
+    server_memory_report_seconds: int = 60
 
     # database settings
     database_hostname: str
@@ -15,6 +25,95 @@ class Settings(BaseSettings):
     database_name: str
     database_username: str
 
+    # inference settings
+    # recognizer of sail numbers, digits segments the number into digits read one
+    # by one, crnn reads the whole number with a sequence model
+    recognizer: str = "digits"
+    # runtime of the digit classifier, one of keras, tflite or onnx
+    inference_backend: str = "keras"
+    model_path: str = "api/ai/cnn_model"
+    tflite_model_path: str = "api/ai/cnn_model.tflite"
+    onnx_model_path: str = "api/ai/cnn_model.onnx"
+    # model of the crnn recognizer, in the format of the inference backend
+    crnn_model_path: str = "api/ai/crnn_model"
+    # warm the model up in the background when the app starts, otherwise it is
+    # only loaded
+    model_warm_up: bool = True
+    inference_batch_window_ms: float = 5.0
+    inference_batch_size: int = 256
+    # quality gate rejecting unusable photos before recognition, 0 disables a check
+    # smallest laplacian variance of a photo scaled to the contour image size
+    quality_min_sharpness: float = 20.0
+    # range of the mean brightness of a photo, between 0 and 255
+    quality_min_brightness: float = 40.0
+    quality_max_brightness: float = 230.0
+    # smallest standard deviation of the brightness of a photo
+    quality_min_contrast: float = 12.0
+    # smallest number of digit-like contours a photo has to contain
+    quality_min_digits: int = 1
+    # number of recognition results kept for repeated uploads of the same image
+    recognition_cache_size: int = 1024
+    # directory uploads are spooled to until a worker processed them
+    spool_directory: str = "spool"
+    # times a transaction conflicting with a concurrent one is run again
+    database_conflict_retries: int = 5
+    # number of job workers started inside the api process
+    job_workers: int = 1
+    # seconds an idle worker waits before looking for new jobs
+    job_poll_interval: float = 1.0
+    # seconds a worker may process a job before another worker takes it over
+    job_lease_seconds: int = 300
+    # number of attempts before a job is marked as failed
+    job_max_attempts: int = 3
+    # frames per second sampled from finish line videos
+    video_sample_fps: float = 5.0
+    # largest hash distance of a frame to the previous one to skip it as duplicate
+    video_frame_hash_distance: int = 4
+    # number of video frames recognized together
+    video_batch_size: int = 16
+    # number of frames a sail number has to be recognized in to count as finish
+    video_min_detections: int = 2
+    # number of archive photos recognized together
+    archive_batch_size: int = 16
+    # largest archive entry read as a photo, larger entries are skipped
+    archive_max_entry_bytes: int = 64 * 1024 * 1024
+    # milliseconds a streamed frame may take from arrival to its recognition
+    stream_latency_budget_ms: int = 500
+    # number of consecutive frames a sail number has to be recognized in to finish
+    stream_confirm_frames: int = 3
+    # largest edit distance of a prediction to a known sail number to match it
+    sail_number_max_distance: int = 2
+    # admission control, requests over the limits are rejected with 429
+    # uploads handled at once and waiting for their turn per process
+    admission_upload_concurrency: int = 8
+    admission_upload_depth: int = 32
+    # recognitions handled at once and waiting for their turn per process
+    admission_recognize_concurrency: int = 4
+    admission_recognize_depth: int = 16
+    # requests a single client may have handled or waiting per endpoint group
+    admission_per_client: int = 4
+    # queued upload jobs above which uploads are rejected, 0 disables the limit
+    admission_max_job_backlog: int = 1000
+    # seconds clients are asked to wait when the job backlog is full
+    admission_backlog_retry_after: int = 30
+    # identify clients by the x-forwarded-for header set by a trusted proxy
+    admission_trust_forwarded: bool = False
+    # directory the served traffic is captured to for replays, unset disables it
+    capture_directory: Optional[str] = None
+    # largest request body stored with a captured request
+    capture_max_payload_bytes: int = 32 * 1024 * 1024
+    # token of the admin endpoints and the profiling header, unset disables both
+    admin_token: Optional[str] = None
+    # directory the profiles of requests are written to
+    profile_directory: str = "profiles"
+    # interval between the stack samples of a profiled request
+    profile_interval_ms: float = 2.0
+    # number of threads running recognition and scoring off the event loop
+    worker_pool_size: int = 4
+    # inference threads used per operation and between operations, 0 lets it decide
+    tf_intra_op_threads: int = 1
+    tf_inter_op_threads: int = 1
+
     class Config:
         env_file = ".env"
 
@@ -0,0 +1,162 @@
+"""Export the keras digit classifier for the lighter inference backends.
+
+Exports are checked for accuracy parity with keras on rendered digits::
+
+    python -m api.convert export --format tflite --quantize int8
+    python -m api.convert export --format onnx
+    python -m api.convert parity --backend tflite
+
+Exporting to onnx needs ``tf2onnx``.
+"""
+import argparse
+import resource
+import sys
+import time
+from typing import Optional
+
+import numpy as np
+
+from api.config import settings
+from api.inference import (
+    InferenceBackend,
+    KerasBackend,
+    OnnxBackend,
+    TFLiteBackend,
+    create_backend,
+)
+
+
+def render_digits(count: int, seed: int = 0) -> np.ndarray:
+    """Return a batch of rendered digits looking like segmented sail number digits.
+
+    Used as representative data for quantization and for the parity checks.
+    """
+    import cv2
+
+    rng = np.random.default_rng(seed)
+    fonts = (cv2.FONT_HERSHEY_SIMPLEX, cv2.FONT_HERSHEY_DUPLEX)
+
+    digits = np.zeros((count, 28, 28), dtype=np.uint8)
+    for i in range(count):
+        canvas = np.zeros((112, 112), dtype=np.uint8)
+        cv2.putText(
+            canvas,
+            str(rng.integers(10)),
+            (int(rng.integers(20, 36)), int(rng.integers(86, 100))),
+            fonts[rng.integers(len(fonts))],
+            float(rng.uniform(2.4, 3.0)),
+            255,
+            int(rng.integers(6, 12)),
+        )
+        digits[i] = cv2.resize(canvas, (28, 28), interpolation=cv2.INTER_AREA)
+
+    return digits
+
+
+def check_parity(
+    backend: InferenceBackend, reference: InferenceBackend, digits: np.ndarray
+) -> dict:
+    """Return how closely the backend reproduces the reference predictions."""
+    timings = {}
+    predictions = {}
+    for candidate in (reference, backend):
+        candidate.predict(digits[:1])
+        start = time.perf_counter()
+        predictions[candidate.name] = candidate.predict(digits)
+        timings[candidate.name] = time.perf_counter() - start
+
+    expected, actual = predictions[reference.name], predictions[backend.name]
+
+    return {
+        "digits": len(digits),
+        "agreement": float(np.mean(expected.argmax(1) == actual.argmax(1))),
+        "max_abs_diff": float(np.abs(expected - actual).max()),
+        "batch_ms": {name: seconds * 1000 for name, seconds in timings.items()},
+    }
+
+
+def export(
+    output_format: str,
+    quantize: Optional[str],
+    output: str,
+    source: Optional[str] = None,
+):
+    """Export the keras model, the digit classifier by default, to the tflite or
+    onnx format."""
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(source or settings.model_path)
+
+    if output_format == OnnxBackend.name:
+        import tf2onnx
+
+        tf2onnx.convert.from_keras(model, opset=13, output_path=output)
+        return
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantize == "int8":
+        representative = render_digits(500).astype(np.float32)
+        input_shape = (1,) + tuple(model.input_shape[1:])
+
+        def representative_dataset():
+            for digit in representative:
+                yield [digit.reshape(input_shape)]
+
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.uint8
+        converter.inference_output_type = tf.uint8
+    elif quantize == "dynamic":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    with open(output, "wb") as model_file:
+        model_file.write(converter.convert())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export and check inference backends.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="export the keras model")
+    export_parser.add_argument(
+        "--format", choices=(TFLiteBackend.name, OnnxBackend.name), required=True
+    )
+    export_parser.add_argument("--quantize", choices=("int8", "dynamic"))
+    export_parser.add_argument("--output", help="defaults to the configured path")
+    export_parser.add_argument("--min-agreement", type=float, default=0.99)
+
+    parity_parser = commands.add_parser("parity", help="compare a backend to keras")
+    parity_parser.add_argument(
+        "--backend", choices=(TFLiteBackend.name, OnnxBackend.name), required=True
+    )
+    parity_parser.add_argument("--min-agreement", type=float, default=0.99)
+
+    args = parser.parse_args()
+
+    name = args.format if args.command == "export" else args.backend
+    backend = create_backend(name)
+    if args.command == "export":
+        backend.path = args.output or backend.path
+        export(args.format, args.quantize, backend.path)
+        print(f"exported {backend.path}")
+
+    backend.load()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    reference = create_backend(KerasBackend.name)
+    reference.load()
+
+    result = check_parity(backend, reference, render_digits(2000, seed=1))
+    result["max_rss_mb"] = {
+        name: rss_before / 1024,
+        "with keras": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    print(result)
+
+    if result["agreement"] < args.min_agreement:
+        print(f"agreement below {args.min_agreement}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
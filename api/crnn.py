@@ -0,0 +1,169 @@
+"""Build, train and export the sequence model of the crnn recognizer.
+
+The model is trained with a CTC loss on rendered sail numbers, including
+touching digits, which are preprocessed exactly as uploads are::
+
+    python -m api.crnn train --steps 3000 --output api/ai/crnn_model
+    python -m api.crnn export --format tflite --output api/ai/crnn_model.tflite
+
+Set ``RECOGNIZER=crnn`` and ``CRNN_MODEL_PATH`` to serve it.
+"""
+import argparse
+from typing import List, Tuple
+
+import cv2
+import numpy as np
+
+from api.config import settings
+from api.convert import export
+from api.inference import OnnxBackend, TFLiteBackend
+from api.services.sequence import (
+    BLANK,
+    SEQUENCE_HEIGHT,
+    SEQUENCE_WIDTH,
+    ctc_greedy_decode,
+    prepare_sequence,
+)
+
+# fonts the training numbers are rendered with
+FONTS = (cv2.FONT_HERSHEY_SIMPLEX, cv2.FONT_HERSHEY_DUPLEX)
+
+
+def build_crnn():
+    """Return the untrained crnn, reading ``(N, 32, 128)`` number lines into
+    ``(N, 32, 11)`` time step probabilities of the digits and the blank."""
+    import tensorflow as tf
+
+    layers = tf.keras.layers
+
+    inputs = layers.Input((SEQUENCE_HEIGHT, SEQUENCE_WIDTH), name="line")
+    x = layers.Rescaling(1 / 255)(inputs)
+    x = layers.Reshape((SEQUENCE_HEIGHT, SEQUENCE_WIDTH, 1))(x)
+    for filters, pool in ((32, (2, 2)), (64, (2, 2)), (128, (2, 1))):
+        x = layers.Conv2D(filters, 3, padding="same", activation="relu")(x)
+        x = layers.MaxPooling2D(pool)(x)
+
+    # one time step per column of the feature map
+    x = layers.Permute((2, 1, 3))(x)
+    x = layers.Reshape((x.shape[1], x.shape[2] * x.shape[3]))(x)
+    x = layers.Dense(64, activation="relu")(x)
+    x = layers.Bidirectional(layers.LSTM(64, return_sequences=True))(x)
+    outputs = layers.Dense(BLANK + 1, activation="softmax")(x)
+
+    return tf.keras.Model(inputs, outputs, name="crnn")
+
+
+def render_number(number: str, rng: np.random.Generator) -> np.ndarray:
+    """Return a grayscale photo of the number as dark digits on a light sail.
+
+    Digits are placed one by one with a random spacing, which lets neighbouring
+    digits touch or overlap.
+    """
+    font = FONTS[rng.integers(len(FONTS))]
+    scale = float(rng.uniform(5.0, 9.0))
+    thickness = int(rng.integers(12, 28))
+    (width, height), _ = cv2.getTextSize("0", font, scale, thickness)
+    step = int(width * rng.uniform(0.8, 1.2))
+
+    canvas_width = step * len(number) + width + int(rng.integers(80, 400))
+    canvas_height = int(height * rng.uniform(1.8, 3.0))
+    image = np.full((canvas_height, canvas_width), rng.integers(170, 240), np.uint8)
+
+    x = int(rng.integers(20, canvas_width - step * len(number) - width + 21))
+    y = (canvas_height + height) // 2
+    for digit in number:
+        cv2.putText(
+            image, digit, (x, y), font, scale, int(rng.integers(0, 60)), thickness
+        )
+        x += step
+
+    kernel = 2 * int(rng.integers(0, 3)) + 1
+    image = cv2.GaussianBlur(image, (kernel, kernel), 0)
+    image = np.clip(image + rng.normal(0, rng.uniform(0, 4), image.shape), 0, 255)
+
+    return image.astype(np.uint8)
+
+
+def render_sequences(count: int, seed: int = 0) -> Tuple[np.ndarray, List[str]]:
+    """Return a batch of preprocessed number lines and their numbers."""
+    rng = np.random.default_rng(seed)
+
+    numbers = [
+        str(rng.integers(1, 10))
+        + "".join(str(digit) for digit in rng.integers(0, 10, rng.integers(0, 6)))
+        for _ in range(count)
+    ]
+    lines = np.stack([prepare_sequence(render_number(n, rng))[0] for n in numbers])
+
+    return lines, numbers
+
+
+def accuracy(model, count: int = 500, seed: int = -1) -> float:
+    """Return the share of rendered numbers the model reads exactly."""
+    lines, numbers = render_sequences(count, seed=seed % 2**32)
+    decoded = ctc_greedy_decode(np.asarray(model.predict_on_batch(lines)))
+
+    return float(np.mean([number == n for (number, _), n in zip(decoded, numbers)]))
+
+
+def train(steps: int, batch_size: int, output: str, seed: int = 0):
+    """Train the crnn on rendered numbers and save it as keras model."""
+    import tensorflow as tf
+
+    model = build_crnn()
+    optimizer = tf.keras.optimizers.Adam(1e-3)
+    time_steps = model.output_shape[1]
+
+    for step in range(steps):
+        lines, numbers = render_sequences(batch_size, seed=seed + step)
+        labels = np.zeros((batch_size, max(map(len, numbers))), dtype=np.int64)
+        for i, number in enumerate(numbers):
+            labels[i, : len(number)] = [int(digit) for digit in number]
+        label_length = np.array([[len(number)] for number in numbers])
+        input_length = np.full((batch_size, 1), time_steps)
+
+        with tf.GradientTape() as tape:
+            loss = tf.reduce_mean(
+                tf.keras.backend.ctc_batch_cost(
+                    labels, model(lines, training=True), input_length, label_length
+                )
+            )
+        gradients = tape.gradient(loss, model.trainable_variables)
+        optimizer.apply_gradients(zip(gradients, model.trainable_variables))
+
+        if step % 100 == 0:
+            print(f"step {step}: loss {float(loss):.4f}")
+
+    print(f"number accuracy: {accuracy(model):.3f}")
+    model.save(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train and export the crnn.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    train_parser = commands.add_parser("train", help="train the crnn")
+    train_parser.add_argument("--steps", type=int, default=3000)
+    train_parser.add_argument("--batch-size", type=int, default=64)
+    train_parser.add_argument("--seed", type=int, default=0)
+    train_parser.add_argument("--output", default=settings.crnn_model_path)
+
+    export_parser = commands.add_parser("export", help="export the keras crnn")
+    export_parser.add_argument(
+        "--format", choices=(TFLiteBackend.name, OnnxBackend.name), required=True
+    )
+    export_parser.add_argument("--quantize", choices=("dynamic",))
+    export_parser.add_argument("--source", default=settings.crnn_model_path)
+    export_parser.add_argument("--output", required=True)
+
+    args = parser.parse_args()
+
+    if args.command == "train":
+        train(args.steps, args.batch_size, args.output, args.seed)
+    else:
+        export(args.format, args.quantize, args.output, source=args.source)
+        print(f"exported {args.output}")
+
+
+if __name__ == "__main__":
+    main()
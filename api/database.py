@@ -1,10 +1,13 @@
 import datetime
+import random
+import time
 import uuid
 
 import pytz
 import sqlalchemy as sa
 from sqlalchemy import create_engine
 from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.declarative import as_declarative, declared_attr
 from sqlalchemy.orm import sessionmaker
 
@@ -16,6 +19,10 @@ engine = create_engine(SQLALCHEMY_DATABASE_URL)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# postgres errors of transactions conflicting with concurrent ones, which succeed
+# when run again: unique violations, serialization failures and deadlocks
+CONFLICT_CODES = {"23505", "40001", "40P01"}
+
 
 @as_declarative()
 class Base:
@@ -30,7 +37,7 @@ class Base:
     created_at = sa.Column(
         sa.DateTime(timezone=True),
         nullable=False,
-        default=datetime.datetime.now(tz=pytz.utc),
+        default=lambda: datetime.datetime.now(tz=pytz.utc),
         server_default=sa.func.now(),
     )
 
@@ -38,8 +45,8 @@ class Base:
     updated_at = sa.Column(
         sa.DateTime(timezone=True),
         nullable=False,
-        default=datetime.datetime.now(tz=pytz.utc),
-        onupdate=datetime.datetime.now(tz=pytz.utc),
+        default=lambda: datetime.datetime.now(tz=pytz.utc),
+        onupdate=lambda: datetime.datetime.now(tz=pytz.utc),
         server_default=sa.func.now(),
         server_onupdate=sa.func.now(),
     )
@@ -58,3 +65,42 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def run_with_session(func, *args, **kwargs):
+    """Run ``func`` with a session of its own as ``db``, closed afterwards.
+
+    For work outside of requests, as sessions can not be shared across threads.
+    """
+    db = SessionLocal()
+    try:
+        return func(*args, db=db, **kwargs)
+    finally:
+        db.close()
+
+
+def run_transaction(db, func, *args, **kwargs):
+    """Run ``func`` and commit, running it again when it conflicted with a
+    concurrent transaction.
+
+    ``func`` must start from what is in the database, every attempt is rolled
+    back completely before the next one. Other errors roll back and are raised.
+    """
+    for attempt in range(settings.database_conflict_retries + 1):
+        try:
+            result = func(*args, **kwargs)
+            db.commit()
+            return result
+        except DBAPIError as e:
+            db.rollback()
+            code = getattr(e.orig, "pgcode", None)
+            if (
+                code not in CONFLICT_CODES
+                or attempt == settings.database_conflict_retries
+            ):
+                raise
+            # spread the retries of transactions that conflicted with each other
+            time.sleep(random.uniform(0, 0.01 * 2**attempt))
+        except Exception:
+            db.rollback()
+            raise
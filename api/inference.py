@@ -0,0 +1,235 @@
+"""Inference backends of the digit classifier.
+
+The tflite backend uses ``tflite_runtime`` when installed and TensorFlow
+otherwise, the onnx backend needs ``onnxruntime``. Models for them are exported
+from the keras model with ``python -m api.convert``.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional, Type
+
+import numpy as np
+
+from api.config import settings
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class InferenceBackend:
+    """Represent a runtime predicting the class probabilities of digit batches."""
+
+    name = ""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self):
+        """Load the model, called once before the first prediction."""
+        raise NotImplementedError
+
+    def predict(self, digits: np.ndarray) -> np.ndarray:
+        """Return the class probabilities of a batch of model inputs.
+
+        Inputs are ``(N, 28, 28)`` digits for the digit classifier and
+        ``(N, 32, 128)`` number lines for the sequence model.
+        """
+        raise NotImplementedError
+
+
+class KerasBackend(InferenceBackend):
+    """Represent the keras model run by TensorFlow."""
+
+    name = "keras"
+
+    def load(self):
+        import tensorflow as tf
+
+        tf.config.threading.set_intra_op_parallelism_threads(
+            settings.tf_intra_op_threads
+        )
+        tf.config.threading.set_inter_op_parallelism_threads(
+            settings.tf_inter_op_threads
+        )
+        self._model = tf.keras.models.load_model(self.path)
+
+    def predict(self, digits: np.ndarray) -> np.ndarray:
+        return np.asarray(self._model.predict_on_batch(digits))
+
+
+class TFLiteBackend(InferenceBackend):
+    """Represent a (possibly int8 quantized) tflite model run by its interpreter."""
+
+    name = "tflite"
+
+    def load(self):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+
+        self._interpreter = Interpreter(
+            model_path=self.path, num_threads=settings.tf_intra_op_threads or None
+        )
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self._batch_size = None
+        # the interpreter must not be invoked from two threads at once
+        self._lock = threading.Lock()
+
+    def predict(self, digits: np.ndarray) -> np.ndarray:
+        input_shape = (len(digits),) + tuple(self._input["shape"][1:])
+        batch = digits.reshape(input_shape).astype(np.float32)
+
+        scale, zero_point = self._input["quantization"]
+        if scale:
+            # saturate instead of wrapping around outside the integer range
+            info = np.iinfo(self._input["dtype"])
+            batch = np.clip(np.round(batch / scale + zero_point), info.min, info.max)
+        batch = batch.astype(self._input["dtype"])
+
+        with self._lock:
+            if self._batch_size != len(digits):
+                self._interpreter.resize_tensor_input(self._input["index"], input_shape)
+                self._interpreter.allocate_tensors()
+                self._batch_size = len(digits)
+
+            self._interpreter.set_tensor(self._input["index"], batch)
+            self._interpreter.invoke()
+            predictions = self._interpreter.get_tensor(self._output["index"])
+
+        scale, zero_point = self._output["quantization"]
+        if scale:
+            predictions = (predictions.astype(np.float32) - zero_point) * scale
+
+        return predictions
+
+
+class OnnxBackend(InferenceBackend):
+    """Represent an onnx model run by onnx runtime."""
+
+    name = "onnx"
+
+    def load(self):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = settings.tf_intra_op_threads
+        options.inter_op_num_threads = settings.tf_inter_op_threads
+        self._session = ort.InferenceSession(
+            self.path, options, providers=["CPUExecutionProvider"]
+        )
+        self._input = self._session.get_inputs()[0]
+
+    def predict(self, digits: np.ndarray) -> np.ndarray:
+        input_shape = (len(digits),) + tuple(
+            side if isinstance(side, int) else 1 for side in self._input.shape[1:]
+        )
+        batch = digits.reshape(input_shape).astype(np.float32)
+
+        return self._session.run(None, {self._input.name: batch})[0]
+
+
+# the inference backends by name
+BACKENDS: Dict[str, Type[InferenceBackend]] = {
+    backend.name: backend for backend in (KerasBackend, TFLiteBackend, OnnxBackend)
+}
+
+
+def create_backend(name: str, path: Optional[str] = None) -> InferenceBackend:
+    """Return the inference backend of the name, loading the configured model
+    of the digit classifier unless another path is given."""
+    paths = {
+        KerasBackend.name: settings.model_path,
+        TFLiteBackend.name: settings.tflite_model_path,
+        OnnxBackend.name: settings.onnx_model_path,
+    }
+    if name not in BACKENDS:
+        raise ValueError(f"unknown inference backend {name}")
+
+    return BACKENDS[name](path or paths[name])
+
+
+class ModelProvider:
+    """Represent the digit classifier, loaded on first use and warmed up on startup.
+
+    The inference runtime is only imported when the model is first needed, so
+    processes that never predict (migrations, scripts) do not pay for it.
+    """
+
+    def __init__(self, backend: InferenceBackend, input_shape=(28, 28)):
+        self.backend = backend
+        # shape of a single model input, used for warming up
+        self.input_shape = tuple(input_shape)
+        self.ready = False
+        # cold start measurements in seconds, reported by the readiness endpoint
+        self.load_seconds: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+        self.first_predict_seconds: Optional[float] = None
+
+        self._loaded = False
+        self._version: Optional[str] = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> str:
+        return self.backend.path
+
+    @property
+    def version(self) -> str:
+        """Return an identifier of the model files, changing when they are replaced."""
+        if self._version is None:
+            try:
+                modified = os.stat(self.path).st_mtime_ns
+            except OSError:
+                modified = 0
+            self._version = f"{self.backend.name}:{self.path}@{modified}"
+
+        return self._version
+
+    def get(self) -> InferenceBackend:
+        """Return the loaded backend, loading it if needed."""
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._load()
+
+        return self.backend
+
+    def _load(self):
+        start = time.perf_counter()
+        self.backend.load()
+        self._loaded = True
+        # without a warm-up the loaded model is as ready as it gets
+        if not settings.model_warm_up:
+            self.ready = True
+
+        self.load_seconds = time.perf_counter() - start
+        logger.info(f"{self.backend.name} model loaded in {self.load_seconds:.3f}s")
+
+    def warm_up(self):
+        """Trace the model graph on a dummy batch so real requests start fast."""
+        backend = self.get()
+
+        start = time.perf_counter()
+        backend.predict(np.zeros((1,) + self.input_shape, dtype=np.uint8))
+        self.warmup_seconds = time.perf_counter() - start
+        self.ready = True
+
+        logger.info(f"model warmed up in {self.warmup_seconds:.3f}s")
+
+    def predict(self, digits: np.ndarray) -> np.ndarray:
+        """Return the class probabilities of a batch of model inputs."""
+        backend = self.get()
+
+        start = time.perf_counter()
+        predictions = backend.predict(digits)
+
+        if self.first_predict_seconds is None:
+            self.first_predict_seconds = time.perf_counter() - start
+            logger.info(f"first prediction took {self.first_predict_seconds:.3f}s")
+        # a real prediction warmed the model up too, like when the warm-up failed
+        self.ready = True
+
+        return predictions
@@ -0,0 +1,224 @@
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+# all metrics in order of creation, rendered by the metrics endpoint
+REGISTRY: List["Metric"] = []
+
+# default histogram buckets in seconds, from sub-millisecond to ten seconds
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def escape(value) -> str:
+    """Return the label value escaped for the text exposition format."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: Tuple[str, ...], values: Tuple[str, ...], **extra) -> str:
+    """Return the prometheus label set of the label names and values."""
+    pairs = list(zip(names, values)) + list(extra.items())
+    if not pairs:
+        return ""
+
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs) + "}"
+
+
+class Metric:
+    """Representing a metric in the prometheus text exposition format.
+
+    Values are kept per combination of label values. A metric created with a
+    function reads its values from it when rendered instead, the function
+    returns a single value or a dict of values by label values.
+    """
+
+    type = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        function: Optional[Callable] = None,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.function = function
+
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+        REGISTRY.append(self)
+
+    def _add(self, labels: Tuple[str, ...], amount: float):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def _samples(self) -> Dict[Tuple[str, ...], float]:
+        if self.function is None:
+            with self._lock:
+                return dict(self._values)
+
+        values = self.function()
+        if isinstance(values, dict):
+            return {
+                labels if isinstance(labels, tuple) else (labels,): value
+                for labels, value in values.items()
+            }
+
+        return {(): values}
+
+    def render(self) -> List[str]:
+        """Return the lines of the metric in text exposition format."""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for labels, value in self._samples().items():
+            lines.append(
+                f"{self.name}{format_labels(self.labelnames, labels)} {float(value)}"
+            )
+
+        return lines
+
+
+class Counter(Metric):
+    """Representing a monotonically increasing count."""
+
+    type = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        """Increase the count of the label values."""
+        self._add(labels, amount)
+
+
+class Gauge(Metric):
+    """Representing a value that goes up and down."""
+
+    type = "gauge"
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        """Increase the value of the label values."""
+        self._add(labels, amount)
+
+    def dec(self, *labels: str, amount: float = 1.0):
+        """Decrease the value of the label values."""
+        self._add(labels, -amount)
+
+    def set(self, *labels: str, value: float):
+        """Set the value of the label values."""
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(Metric):
+    """Representing the distribution of observed values in cumulative buckets."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+        self._counts: Dict[Tuple[str, ...], List[int]] = {}
+        self._sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, *labels: str, value: float):
+        """Record an observed value of the label values."""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(labels)
+            if counts is None:
+                counts = self._counts[labels] = [0] * (len(self.buckets) + 1)
+                self._sums[labels] = 0.0
+            counts[index] += 1
+            self._sums[labels] += value
+
+    @contextmanager
+    def time(self, *labels: str):
+        """Observe the seconds spent in the block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(*labels, value=time.perf_counter() - start)
+
+    def timed(self, *labels: str):
+        """Decorate a function to observe the seconds spent in each call."""
+
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.time(*labels):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        with self._lock:
+            snapshot = [
+                (labels, list(counts), self._sums[labels])
+                for labels, counts in self._counts.items()
+            ]
+
+        for labels, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(
+                    f"{self.name}_bucket"
+                    f"{format_labels(self.labelnames, labels, le=le)} {cumulative}"
+                )
+            label_set = format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_set} {total}")
+            lines.append(f"{self.name}_count{label_set} {cumulative}")
+
+        return lines
+
+
+def render() -> str:
+    """Return all registered metrics in text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+
+    return "\n".join(lines) + "\n"
+
+
+# the seconds spent in every stage of processing a finish upload
+stage_seconds = Histogram(
+    "recognition_stage_seconds",
+    "Seconds spent per stage of recognizing and recording a finish.",
+    ("stage",),
+)
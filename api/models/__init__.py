@@ -1,5 +1,7 @@
 from api.database import Base
 from api.models.competition import Boat, Competition
 from api.models.competitor import Club, Competitor, Country
+from api.models.job import Job, JobKind, JobStatus
 from api.models.position import Position
 from api.models.race import Race
+from api.models.standing import Standing
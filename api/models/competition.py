@@ -31,6 +31,8 @@ class Competition(Base):
     start_date = sa.Column(sa.Date, nullable=False, index=True)
     # the end date of a competition
     end_date = sa.Column(sa.Date, nullable=False, index=True)
+    # the number of races numbered in the competition, the number of the last one
+    race_count = sa.Column(sa.BigInteger, nullable=False, default=0, server_default="0")
     # the races executed during the competition
     races = relationship(
         "Race",
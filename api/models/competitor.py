@@ -2,7 +2,7 @@ from enum import Enum
 
 import sqlalchemy as sa
 from sqlalchemy import UniqueConstraint
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
 from sqlalchemy.orm import relationship
 
 from api.database import Base
@@ -54,6 +54,10 @@ class Competitor(Base):
     )
     # competitor net points in competition
     net_points = sa.Column(sa.BigInteger, nullable=False, default=0, server_default="0")
+    # competitor points of the discarded results as a min-heap
+    discarded_points = sa.Column(
+        ARRAY(sa.BigInteger), nullable=False, default=list, server_default="{}"
+    )
     # competitor club
     club = sa.Column(sa.Enum(Club), nullable=False, index=True)
     # the competition id in which the competitor takes part
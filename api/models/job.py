@@ -0,0 +1,77 @@
+from enum import Enum
+
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID
+
+from api.database import Base
+
+
+class JobStatus(str, Enum):
+    """Representing the processing state of a job as an enum."""
+
+    QUEUED = "QUEUED"
+    RUNNING = "RUNNING"
+    DONE = "DONE"
+    FAILED = "FAILED"
+
+    def __repr__(self) -> str:
+        return self.name
+
+    def __str__(self) -> str:
+        return self.value
+
+
+class JobKind(str, Enum):
+    """Representing the kind of upload processed by a job as an enum."""
+
+    PHOTO = "PHOTO"
+    VIDEO = "VIDEO"
+    ARCHIVE = "ARCHIVE"
+
+    def __repr__(self) -> str:
+        return self.name
+
+    def __str__(self) -> str:
+        return self.value
+
+
+class Job(Base):
+    """Representing a queued finish upload to be processed as a database table."""
+
+    # the kind of upload processed by the job
+    kind = sa.Column(
+        sa.Enum(JobKind),
+        nullable=False,
+        default=JobKind.PHOTO,
+        server_default=JobKind.PHOTO.value,
+    )
+    # the processing state of the job
+    status = sa.Column(
+        sa.Enum(JobStatus),
+        nullable=False,
+        default=JobStatus.QUEUED,
+        server_default=JobStatus.QUEUED.value,
+        index=True,
+    )
+    # the race id the upload was taken in
+    race_id = sa.Column(
+        UUID(as_uuid=True),
+        sa.ForeignKey("race.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    # the path of the spooled upload
+    path = sa.Column(sa.VARCHAR(length=512), nullable=False)
+    # the number of times processing the job was started
+    attempts = sa.Column(sa.Integer, nullable=False, default=0, server_default="0")
+    # until when a running job belongs to the worker processing it
+    lease_expires_at = sa.Column(sa.DateTime(timezone=True), nullable=True)
+    # the error of the last failed attempt
+    error = sa.Column(sa.Text, nullable=True)
+    # the sail number the finish of a photo was recorded for
+    sail_nr = sa.Column(sa.BigInteger, nullable=True)
+    # the number of photos of an archive processed so far
+    progress = sa.Column(sa.Integer, nullable=False, default=0, server_default="0")
+    # the number of photos in an archive, unknown for streamed tar archives
+    total = sa.Column(sa.Integer, nullable=True)
+    # the id of the profile of the upload request, to profile processing it too
+    profile_id = sa.Column(sa.VARCHAR(length=32), nullable=True)
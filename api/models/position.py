@@ -1,4 +1,5 @@
 import sqlalchemy as sa
+from sqlalchemy import UniqueConstraint
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 
@@ -11,10 +12,15 @@ class Position(Base):
     # the points for the finishing position
     points = sa.Column(sa.BigInteger, nullable=False)
     # the race id for the finishing position
-    race_id = sa.Column(UUID(as_uuid=True), sa.ForeignKey("race.id"))
+    race_id = sa.Column(UUID(as_uuid=True), sa.ForeignKey("race.id"), index=True)
     # the race object for the finishin position
     race = relationship("Race", back_populates="positions")
     # the competitor id for the finishing position
     sail_nr = sa.Column(sa.BigInteger, sa.ForeignKey("competitor.sail_nr"))
     # the competitor object for the finishing position
     competitor = relationship("Competitor", back_populates="positions")
+
+    __table_args__ = (
+        UniqueConstraint("race_id", "sail_nr", name="_race_id_sail_nr_uc"),
+        UniqueConstraint("race_id", "points", name="_race_id_points_uc"),
+    )
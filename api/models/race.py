@@ -1,4 +1,5 @@
 import sqlalchemy as sa
+from sqlalchemy import UniqueConstraint
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 
@@ -11,9 +12,15 @@ class Race(Base):
     # the race number
     race_nr = sa.Column(sa.BigInteger, nullable=False, index=True)
     # the competition id for the race
-    competition_id = sa.Column(UUID(as_uuid=True), sa.ForeignKey("competition.id"))
+    competition_id = sa.Column(
+        UUID(as_uuid=True), sa.ForeignKey("competition.id"), index=True
+    )
     # the competition for the race
     competition = relationship("Competition", back_populates="races")
+    # the number of finishes allocated in the race, the points of the last one
+    finish_count = sa.Column(
+        sa.BigInteger, nullable=False, default=0, server_default="0"
+    )
     # the finishing positions in the race
     positions = relationship(
         "Position",
@@ -21,3 +28,9 @@ class Race(Base):
         cascade="all, delete",
         lazy="dynamic",
     )
+
+    __table_args__ = (
+        UniqueConstraint(
+            "competition_id", "race_nr", name="_competition_id_race_nr_uc"
+        ),
+    )
@@ -0,0 +1,38 @@
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
+from sqlalchemy.orm import relationship
+
+from api.database import Base
+
+
+class Standing(Base):
+    """Representing the standing of a competitor in the results of a competition as
+    a database table."""
+
+    # the competition id of the results
+    competition_id = sa.Column(
+        UUID(as_uuid=True),
+        sa.ForeignKey("competition.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    # the competitor id of the standing
+    competitor_id = sa.Column(
+        UUID(as_uuid=True),
+        sa.ForeignKey("competitor.id", ondelete="CASCADE"),
+        nullable=False,
+        unique=True,
+    )
+    # the competitor of the standing, loaded with it
+    competitor = relationship("Competitor", lazy="joined")
+    # the rank in the competition, shared by competitors tied on every tie-break
+    rank = sa.Column(sa.BigInteger, nullable=False)
+    # the total points in the competition
+    total_points = sa.Column(sa.BigInteger, nullable=False)
+    # the net points in the competition
+    net_points = sa.Column(sa.BigInteger, nullable=False)
+    # the points of every race in order of the race number, null without a finish
+    race_points = sa.Column(ARRAY(sa.BigInteger), nullable=False)
+
+    __table_args__ = (
+        sa.Index("ix_standing_competition_id_rank", "competition_id", "rank"),
+    )
@@ -0,0 +1,200 @@
+"""Sampling profiler of single requests, enabled per request by an admin header.
+
+With ``ADMIN_TOKEN`` set, a request sent with ``X-Profile: <token>`` is
+profiled while it is handled: a background thread samples the stacks of the
+event loop while it runs the request and of the pool threads running work
+submitted for it. The samples are written as collapsed stacks, the input of
+``flamegraph.pl`` and speedscope, to ``<profile_directory>/<id>.folded`` and
+the id is returned in the ``X-Profile-Id`` header. Without the token set the
+middleware is not installed, other requests only have their headers checked.
+
+The inference batcher threads are sampled as well, they predict the digits of
+concurrent requests together, so their samples may include other requests.
+Uploads sent with the header queue a job carrying the profile id, and the
+worker processing it, in whichever process, writes the samples of the job to
+``<id>.job.folded`` in its own profile directory. The synchronous health,
+ready and metrics routes run in the threadpool of Starlette and are not sampled.
+"""
+import collections
+import contextlib
+import contextvars
+import functools
+import hmac
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from typing import Dict, Iterator, Optional
+
+from api.config import settings
+
+logger = logging.getLogger("uvicorn.error")
+
+# threads working for all requests, sampled while any of them is profiled
+SHARED_THREADS = ("inference-batcher",)
+
+# the profile of the request being handled, read when work is sent to the pool
+current_profile: contextvars.ContextVar[Optional["Profile"]] = contextvars.ContextVar(
+    "current_profile", default=None
+)
+
+
+def frame_name(frame) -> str:
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{frame.f_globals.get('__name__', '?')}:{name}"
+
+
+class Profile:
+    """Sample the stacks of the work of one request at a fixed interval.
+
+    The thread starting the profile is sampled only while it runs a frame below
+    ``root``, the frame the request is handled in on the event loop, so
+    concurrent requests are left out. Without ``root`` its whole stack is.
+    """
+
+    def __init__(self, root, interval: float, id: Optional[str] = None):
+        self.id = id or uuid.uuid4().hex
+        self.root = root
+        self.interval = interval
+        self.loop_thread = threading.get_ident()
+        self.samples: Dict[str, int] = collections.Counter()
+
+        self._threads: Dict[int, int] = collections.Counter()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(
+            target=self._run, name=f"profile-{self.id[:8]}", daemon=True
+        )
+
+    def wrap(self, func):
+        """Return ``func`` with the thread running it sampled as part of the request."""
+
+        @functools.wraps(func)
+        def sampled(*args, **kwargs):
+            thread = threading.get_ident()
+            self._threads[thread] += 1
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._threads[thread] -= 1
+
+        return sampled
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        self._sampler.join()
+        self.seconds = time.perf_counter() - self.started
+
+    def _run(self):
+        names = {}
+        while not self._stop.wait(self.interval):
+            threads = [thread for thread, count in list(self._threads.items()) if count]
+            threads.extend(
+                thread.ident
+                for thread in threading.enumerate()
+                if thread.name.startswith(SHARED_THREADS)
+            )
+            frames = sys._current_frames()
+
+            for thread in [self.loop_thread, *threads]:
+                frame = frames.get(thread)
+                stack = []
+                while frame is not None:
+                    stack.append(frame_name(frame))
+                    if thread == self.loop_thread and frame is self.root:
+                        break
+                    frame = frame.f_back
+                else:
+                    # the event loop was busy with something else
+                    if thread == self.loop_thread and self.root is not None:
+                        continue
+
+                if thread not in names:
+                    names[thread] = next(
+                        (t.name for t in threading.enumerate() if t.ident == thread),
+                        str(thread),
+                    )
+                stack.append(names[thread])
+                self.samples[";".join(reversed(stack))] += 1
+
+    def save(self, directory: str, suffix: str = "") -> str:
+        """Write the samples as collapsed stacks and return the file path."""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.id}{suffix}.folded")
+        with open(path, "w") as output:
+            for stack, count in sorted(self.samples.items()):
+                output.write(f"{stack} {count}\n")
+
+        return path
+
+
+@contextlib.contextmanager
+def profile_job(profile_id: Optional[str]) -> Iterator[None]:
+    """Sample the current thread while it processes a job queued by a profiled
+    request, nothing is sampled for jobs without a profile id."""
+    if profile_id is None:
+        yield
+        return
+
+    profile = Profile(None, settings.profile_interval_ms / 1000, profile_id)
+    profile.start()
+    try:
+        yield
+    finally:
+        profile.stop()
+
+        path = profile.save(settings.profile_directory, ".job")
+        logger.info(
+            f"profiled job of {profile.id} in {profile.seconds * 1000:.0f} ms, "
+            f"{sum(profile.samples.values())} samples written to {path}"
+        )
+
+
+class ProfileMiddleware:
+    """Profile the requests carrying the admin token in the ``X-Profile`` header."""
+
+    def __init__(self, app, token: str, directory: str):
+        self.app = app
+        self.token = token.encode()
+        self.directory = directory
+
+    def authorized(self, scope) -> bool:
+        for name, value in scope.get("headers", ()):
+            if name == b"x-profile":
+                return hmac.compare_digest(value, self.token)
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.authorized(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(sys._getframe(), settings.profile_interval_ms / 1000)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", ()))
+                headers.append((b"x-profile-id", profile.id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = current_profile.set(profile)
+        profile.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profile.stop()
+            current_profile.reset(token)
+
+            path = profile.save(self.directory)
+            logger.info(
+                f"profiled {scope['method']} {scope['path']} in "
+                f"{profile.seconds * 1000:.0f} ms, "
+                f"{sum(profile.samples.values())} samples written to {path}"
+            )
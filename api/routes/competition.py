@@ -1,6 +1,5 @@
 from typing import List
 
-import pandas as pd
 from fastapi import (
     APIRouter,
     Depends,
@@ -14,10 +13,19 @@ from pydantic import UUID4
 from sqlalchemy.orm import Session
 
 from api import get_db
-from api.models import Boat, Club, Competition, Competitor, Country
+from api.auth import require_admin
+from api.models import Boat, Club, Competition, Competitor, Country, Standing
 from api.schemas.competition import CompetitionCreate, CompetitionOut, CompetitionUpdate
 from api.schemas.competitor import CompetitorCreate, CompetitorOut
 from api.schemas.race import RaceOut
+from api.schemas.standing import StandingOut
+from api.services import (
+    refresh_leaderboard,
+    remove_spool_file,
+    rescore_competition,
+    sail_numbers,
+    spool_files_of_races,
+)
 
 router = APIRouter(prefix="/competitions", tags=["Competitions"])
 
@@ -89,8 +97,13 @@ async def delete(id: UUID4, db: Session = Depends(get_db)):
             status_code=status.HTTP_404_NOT_FOUND, detail="competition not found"
         )
 
+    # the jobs of its races are deleted with them, their uploads are left over
+    spool_files = spool_files_of_races(db, [race.id for race in competition.races])
     db.delete(competition)
     db.commit()
+    sail_numbers.invalidate(id)
+    for path in spool_files:
+        remove_spool_file(path)
 
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
@@ -126,11 +139,33 @@ async def get_competiton_races(id: UUID4, db: Session = Depends(get_db)):
 
 
 @router.get(
-    "/{id}/results", status_code=status.HTTP_200_OK, response_model=List[CompetitorOut]
+    "/{id}/results", status_code=status.HTTP_200_OK, response_model=List[StandingOut]
 )
 async def get_competition_results(id: UUID4, db: Session = Depends(get_db)):
-    """Handle returning the results of the competition to the user."""
+    """Handle returning the ranked results of the competition to the user."""
+    standings: List[Standing] = (
+        db.query(Standing)
+        .filter(Standing.competition_id == id)
+        .order_by(Standing.rank, Standing.competitor_id)
+        .all()
+    )
 
+    if not standings and not db.query(Competition).get(id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="competition not found"
+        )
+
+    return standings
+
+
+@router.post(
+    "/{id}/recompute",
+    status_code=status.HTTP_200_OK,
+    response_model=List[CompetitorOut],
+    dependencies=[Depends(require_admin)],
+)
+async def recompute_competition_results(id: UUID4, db: Session = Depends(get_db)):
+    """Handle rebuilding the points of all competitors from their positions."""
     competition: Competition = db.query(Competition).get(id)
 
     if not competition:
@@ -138,7 +173,10 @@ async def get_competition_results(id: UUID4, db: Session = Depends(get_db)):
             status_code=status.HTTP_404_NOT_FOUND, detail="competition not found"
         )
 
-    return competition.competitors.order_by(Competitor.total_points).all()
+    rescore_competition(db, id)
+    db.commit()
+
+    return competition.competitors.order_by(Competitor.net_points).all()
 
 
 @router.post(
@@ -161,6 +199,8 @@ async def add_competitors_by_csv(
             status_code=status.HTTP_404_NOT_FOUND, detail="competition not found"
         )
 
+    import pandas as pd
+
     df = pd.read_csv(competitors.file)
     df = df.reset_index()
 
@@ -184,7 +224,10 @@ async def add_competitors_by_csv(
         new_competitors.append(Competitor(**create_competitor.dict()))
 
     db.add_all(new_competitors)
+    db.flush()
+    refresh_leaderboard(db, id)
     db.commit()
+    sail_numbers.invalidate(id)
 
     return new_competitors
 
@@ -210,6 +253,8 @@ async def add_competitors_by_xlsx(
             status_code=status.HTTP_404_NOT_FOUND, detail="competition not found"
         )
 
+    import pandas as pd
+
     df = pd.read_excel(competitors.file)
     df = df.reset_index()
 
@@ -233,7 +278,10 @@ async def add_competitors_by_xlsx(
         new_competitors.append(Competitor(**create_competitor.dict()))
 
     db.add_all(new_competitors)
+    db.flush()
+    refresh_leaderboard(db, id)
     db.commit()
+    sail_numbers.invalidate(id)
 
     return new_competitors
 
@@ -259,6 +307,8 @@ async def add_competitors_by_json(
             status_code=status.HTTP_404_NOT_FOUND, detail="competition not found"
         )
 
+    import pandas as pd
+
     df = pd.read_json(competitors.file)
     df = df.reset_index()
 
@@ -282,6 +332,9 @@ async def add_competitors_by_json(
         new_competitors.append(Competitor(**create_competitor.dict()))
 
     db.add_all(new_competitors)
+    db.flush()
+    refresh_leaderboard(db, id)
     db.commit()
+    sail_numbers.invalidate(id)
 
     return new_competitors
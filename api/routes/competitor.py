@@ -5,10 +5,17 @@ from pydantic import UUID4
 from sqlalchemy.orm import Session
 
 from api import get_db
+from api.database import run_transaction
 from api.models import Competitor
 from api.models.competition import Competition
 from api.schemas.competitor import CompetitorCreate, CompetitorOut, CompetitorUpdated
 from api.schemas.position import PositionOut
+from api.services import (
+    lock_competitors,
+    refresh_leaderboard,
+    rescore_competition,
+    sail_numbers,
+)
 
 router = APIRouter(prefix="/competitors", tags=["Competitors"])
 
@@ -72,7 +79,10 @@ async def create(create_competitor: CompetitorCreate, db: Session = Depends(get_
 
     new_competitor: Competitor = Competitor(**create_competitor.dict())
     db.add(new_competitor)
+    db.flush()
+    refresh_leaderboard(db, new_competitor.competition_id)
     db.commit()
+    sail_numbers.invalidate(new_competitor.competition_id)
 
     return new_competitor
 
@@ -83,15 +93,42 @@ async def update(
 ):
     """Handle updating a competitor."""
     competitor_query = db.query(Competitor).filter(Competitor.id == id)
-    competitor: Competitor = competitor_query.first()
 
-    if not competitor:
+    def update_competitor_scores():
+        competitor: Competitor = competitor_query.first()
+        if not competitor:
+            return None
+
+        # the competitors are locked before the update, in the same order as the
+        # finishes lock them, so recording finishes meanwhile can not deadlock
+        competition_ids = set()
+        while competitor.competition_id not in competition_ids:
+            competition_ids |= {
+                competitor.competition_id,
+                update_competitor.competition_id,
+            }
+            for competition_id in sorted(competition_ids):
+                lock_competitors(db, competition_id)
+            # it may have been moved to another competition before it was locked
+            db.refresh(competitor)
+        previous_competition_id = competitor.competition_id
+
+        competitor_query.update(update_competitor.dict())
+        # the sail number and competition decide which finishes count for the
+        # competitor
+        for competition_id in sorted(competition_ids):
+            rescore_competition(db, competition_id)
+
+        return previous_competition_id
+
+    previous_competition_id = run_transaction(db, update_competitor_scores)
+    if previous_competition_id is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="competitor not found"
         )
 
-    competitor_query.update(update_competitor.dict())
-    db.commit()
+    sail_numbers.invalidate(previous_competition_id)
+    sail_numbers.invalidate(update_competitor.competition_id)
 
     return competitor_query.first()
 
@@ -106,7 +143,11 @@ async def delete(id: UUID4, db: Session = Depends(get_db)):
             status_code=status.HTTP_404_NOT_FOUND, detail="competitor not found"
         )
 
+    competition_id = competitor.competition_id
     db.delete(competitor)
+    db.flush()
+    refresh_leaderboard(db, competition_id)
     db.commit()
+    sail_numbers.invalidate(competition_id)
 
     return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -1,34 +1,44 @@
-import difflib
-from typing import Any, List
+import asyncio
+import os
+import time
+from typing import Any, List, Optional
 
-import cv2
-import numpy as np
 from fastapi import (
     APIRouter,
-    BackgroundTasks,
     Depends,
     File,
     HTTPException,
     Response,
     UploadFile,
+    WebSocket,
+    WebSocketDisconnect,
     status,
 )
 from pydantic import UUID4
 from sqlalchemy.orm import Session
 
-from api import get_db, model
-from api.models import Competition, Competitor, Position, Race
+from api import get_db, settings
+from api.database import run_with_session
+from api.models import Job, JobKind, Position, Race
+from api.schemas.job import JobOut
 from api.schemas.position import PositionOut, PositionUpdate
 from api.services import (
-    combine_digits_to_full_number,
-    get_countours,
-    seperate_number_into_digits,
-    sort_contours,
-    update_ranking,
+    FinishDetector,
+    enqueue_upload,
+    predict_sail_number,
+    recognition_cache,
+    recognize_image,
+    record_finishes,
+    rescore_competition,
+    run_in_pool,
+    sail_numbers,
 )
 
 router = APIRouter(prefix="/positions", tags=["Positions"])
 
+# file name endings of the accepted photo archives
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
 
 @router.get("/", status_code=status.HTTP_200_OK, response_model=List[PositionOut])
 async def read(db: Session = Depends(get_db)):
@@ -50,10 +60,9 @@ async def get_by_id(id: UUID4, db: Session = Depends(get_db)):
     return position
 
 
-@router.post("/", status_code=status.HTTP_202_ACCEPTED, response_model=PositionOut)
+@router.post("/", status_code=status.HTTP_202_ACCEPTED, response_model=JobOut)
 async def create(
     race_id: UUID4,
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
 ):
@@ -69,10 +78,85 @@ async def create(
             status_code=status.HTTP_404_NOT_FOUND, detail="race does not exist"
         )
 
-    # set up background task to calculate new points and positions
-    background_tasks.add_task(update_ranking, race_id, file, db)
+    # queue a job for the workers to calculate new points and positions
+    job: Job = await run_in_pool(
+        enqueue_upload, race_id, file.file, JobKind.PHOTO, ".jpg", db
+    )
+
+    return job
+
+
+@router.post("/video", status_code=status.HTTP_202_ACCEPTED, response_model=JobOut)
+async def create_from_video(
+    race_id: UUID4,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+):
+    """Handle creating the positions of all finishes recorded in a video."""
+    if not file.content_type.startswith("video/"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="the file must be a video",
+        )
+
+    if not db.query(Race).get(race_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="race does not exist"
+        )
+
+    # the video is streamed to the spool directory and sampled by a worker
+    suffix = os.path.splitext(file.filename or "")[1] or ".mp4"
+    job: Job = await run_in_pool(
+        enqueue_upload, race_id, file.file, JobKind.VIDEO, suffix, db
+    )
+
+    return job
 
-    return Response(status_code=status.HTTP_202_ACCEPTED)
+
+@router.post("/archive", status_code=status.HTTP_202_ACCEPTED, response_model=JobOut)
+async def create_from_archive(
+    race_id: UUID4,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+):
+    """Handle creating the positions of all finish photos in a zip or tar archive.
+
+    The progress of the returned job is reported while the photos are processed.
+    """
+    filename = (file.filename or "").lower()
+    suffix = next(
+        (suffix for suffix in ARCHIVE_SUFFIXES if filename.endswith(suffix)), None
+    )
+    if suffix is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="the file must be a zip or tar archive",
+        )
+
+    if not db.query(Race).get(race_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="race does not exist"
+        )
+
+    # the archive is streamed to the spool directory and read by a worker
+    job: Job = await run_in_pool(
+        enqueue_upload, race_id, file.file, JobKind.ARCHIVE, suffix, db
+    )
+
+    return job
+
+
+@router.get("/jobs/{id}", status_code=status.HTTP_200_OK, response_model=JobOut)
+async def get_job(id: UUID4, db: Session = Depends(get_db)):
+    """Handle returning the processing state of a finish upload to the user."""
+    job: Job = db.query(Job).get(id)
+
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="job not found"
+        )
+
+    return job
 
 
 @router.put("/{id}", status_code=status.HTTP_501_NOT_IMPLEMENTED, response_model=Any)
@@ -93,14 +177,25 @@ async def delete(id: UUID4, db: Session = Depends(get_db)):
             status_code=status.HTTP_404_NOT_FOUND, detail="position not found"
         )
 
+    competition_id = position.race.competition_id
     db.delete(position)
+    db.flush()
+    # the points of the finish are taken off the competitor
+    rescore_competition(db, competition_id)
     db.commit()
 
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
+@router.get("/recognize/cache", status_code=status.HTTP_200_OK)
+async def get_recognition_cache_stats():
+    """Handle returning the hit and miss counters of the recognition cache."""
+    return recognition_cache.stats()
+
+
 @router.post("/recognize", status_code=status.HTTP_200_OK)
 async def recognize(
+    competition_id: Optional[UUID4] = None,
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
 ):
@@ -110,31 +205,123 @@ async def recognize(
             detail="the file must be a jpg or jpeg",
         )
 
-    contents = file.file.read()
-    nparr = np.array(bytearray(contents), dtype="uint8")
-    image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    contents = await file.read()
 
-    contours, image = get_countours(image=image)
+    # run the recognition pipeline and matching off the event loop
+    try:
+        predicted_number, closest_numbers = await run_in_pool(
+            predict_sail_number, contents, db, competition_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    return {"closest_match": closest_numbers, "prediction": predicted_number}
 
-    # put in function to get sorted countours
-    digit_boxes = sort_contours(contours)
 
-    # put in function to get single digits to predict
-    digits = seperate_number_into_digits(image, digit_boxes)
+@router.websocket("/stream/{race_id}")
+async def stream(websocket: WebSocket, race_id: UUID4):
+    """Handle recognizing the finishes in a stream of jpeg frames of a race.
 
-    # model predicts
-    predictions = model.predict(digits)
+    Only the most recent frame is kept while a frame is being recognized, and
+    frames older than the latency budget are dropped instead of processed late.
+    At most one recognition of the connection runs in the pool at a time, a
+    recognition over the budget is left to finish and its result dropped.
+    Every database access has a session of its own, so a connection does not
+    hold one while it waits for frames.
+    """
+    race: Optional[Race] = run_with_session(lambda db: db.query(Race).get(race_id))
 
-    # pu in function to get full number prediction
-    predicted_number = combine_digits_to_full_number(predictions)
+    await websocket.accept()
 
-    competition: Competition = db.query(Competition).first()
-    possibilities = [
-        str(competitor.sail_nr)
-        for competitor in db.query(Competitor)
-        .filter(Competitor.competition_id == competition.id)
-        .all()
-    ]
-    closest_numbers = difflib.get_close_matches(predicted_number, possibilities)
+    if not race:
+        await websocket.close(code=1008, reason="race does not exist")
+        return
 
-    return {"closest_match": closest_numbers, "prediction": predicted_number}
+    budget = settings.stream_latency_budget_ms / 1000
+    detector = FinishDetector(settings.stream_confirm_frames)
+    latest = None
+    dropped = 0
+    closed = False
+    frame_ready = asyncio.Event()
+    # the recognition still running in the pool after its frame ran late
+    late: Optional[asyncio.Task] = None
+
+    async def receive():
+        nonlocal latest, dropped, closed
+        try:
+            while True:
+                contents = await websocket.receive_bytes()
+                if latest is not None:
+                    dropped += 1
+                latest = (time.perf_counter(), contents)
+                frame_ready.set()
+        except (WebSocketDisconnect, RuntimeError):
+            closed = True
+            frame_ready.set()
+
+    receiver = asyncio.create_task(receive())
+
+    try:
+        while True:
+            await frame_ready.wait()
+            frame_ready.clear()
+            if closed:
+                break
+            if late is not None:
+                # newer frames replace the latest one meanwhile
+                await asyncio.wait({late})
+                late = None
+            if latest is None:
+                continue
+
+            (received_at, contents), latest = latest, None
+            if time.perf_counter() - received_at > budget:
+                dropped += 1
+                continue
+
+            recognizing = asyncio.create_task(run_in_pool(recognize_image, contents))
+            await asyncio.wait(
+                {recognizing}, timeout=budget - (time.perf_counter() - received_at)
+            )
+            if not recognizing.done():
+                late = recognizing
+                # its result is dropped, the error is retrieved to not be logged
+                late.add_done_callback(
+                    lambda task: task.cancelled() or task.exception()
+                )
+                dropped += 1
+                frame_ready.set()
+                continue
+
+            try:
+                recognition = recognizing.result()
+            except ValueError as e:
+                await websocket.send_json({"error": str(e)})
+                continue
+
+            matches = await run_in_pool(
+                run_with_session,
+                sail_numbers.closest,
+                competition_id=race.competition_id,
+                number=recognition.number,
+                n=1,
+            )
+            sail_nr = int(matches[0]) if matches else None
+
+            finished = detector.observe(sail_nr)
+            if finished:
+                await run_in_pool(run_with_session, record_finishes, race_id, [sail_nr])
+
+            await websocket.send_json(
+                {
+                    "prediction": recognition.number,
+                    "sail_nr": sail_nr,
+                    "finished": finished,
+                    "latency_ms": round((time.perf_counter() - received_at) * 1000),
+                    "dropped_frames": dropped,
+                }
+            )
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
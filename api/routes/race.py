@@ -1,13 +1,24 @@
 from typing import Any, List
 
-from fastapi import APIRouter, Depends, HTTPException, Response, status
-from pydantic import UUID4
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from pydantic import UUID4, parse_obj_as
 from sqlalchemy.orm import Session
 
 from api import get_db
 from api.models import Competition, Race
 from api.schemas.position import PositionOut
 from api.schemas.race import RaceCreate, RaceOut, RaceUpdate
+from api.services import (
+    discard_count,
+    next_race_nr,
+    parse_finish_order,
+    record_finish_order,
+    refresh_leaderboard,
+    remove_spool_file,
+    rescore_competition,
+    run_in_pool,
+    spool_files_of_races,
+)
 
 router = APIRouter(prefix="/races", tags=["Races"])
 
@@ -43,16 +54,20 @@ async def create(create_race: RaceCreate, db: Session = Depends(get_db)):
             status_code=status.HTTP_404_NOT_FOUND, detail="competition not found"
         )
 
-    new_race.race_nr = (
-        db.query(Race).filter(Race.competition_id == new_race.competition_id).count()
-        + 1
-    )
+    new_race.race_nr = next_race_nr(db, new_race.competition_id)
 
     db.add(new_race)
+    db.flush()
+    # one more result is discarded every few races, which changes the net points
+    race_count = (
+        db.query(Race).filter(Race.competition_id == new_race.competition_id).count()
+    )
+    if discard_count(race_count) != discard_count(race_count - 1):
+        rescore_competition(db, new_race.competition_id)
+    else:
+        refresh_leaderboard(db, new_race.competition_id)
     db.commit()
 
-    print(new_race.__dict__)
-
     return new_race
 
 
@@ -80,8 +95,15 @@ async def delete(id: UUID4, db: Session = Depends(get_db)):
             status_code=status.HTTP_404_NOT_FOUND, detail="race not found"
         )
 
+    # the jobs of the race are deleted with it, their uploads are left over
+    spool_files = spool_files_of_races(db, [race.id])
     db.delete(race)
+    db.flush()
+    # the finishes of the race are gone and fewer results may be discarded
+    rescore_competition(db, race.competition_id)
     db.commit()
+    for path in spool_files:
+        remove_spool_file(path)
 
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
@@ -99,3 +121,42 @@ async def get_positions(id: UUID4, db: Session = Depends(get_db)):
         )
 
     return race.positions.all()
+
+
+@router.post(
+    "/{id}/finishes",
+    status_code=status.HTTP_201_CREATED,
+    response_model=List[PositionOut],
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {
+                    "schema": {"type": "array", "items": {"type": "integer"}}
+                },
+                "text/csv": {"schema": {"type": "string"}},
+            },
+        }
+    },
+)
+async def add_finishes(id: UUID4, request: Request, db: Session = Depends(get_db)):
+    """Handle adding the finish order of a race, as a json list or a csv of the
+    sail numbers in their finishing order."""
+    race: Race = db.query(Race).get(id)
+
+    if not race:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="race not found"
+        )
+
+    try:
+        if "csv" in request.headers.get("content-type", ""):
+            sail_nrs = parse_finish_order(await request.body())
+        else:
+            sail_nrs = parse_obj_as(List[int], await request.json())
+
+        positions = await run_in_pool(record_finish_order, race.id, sail_nrs, db)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    return positions
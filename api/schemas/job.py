@@ -0,0 +1,27 @@
+import datetime
+from typing import Optional
+
+from pydantic import UUID4, BaseModel
+
+from api.models import JobKind, JobStatus
+
+
+class JobOut(BaseModel):
+    """Representing a finish upload processing job that is returned to a user as schema."""
+
+    id: UUID4
+    kind: JobKind
+    status: JobStatus
+    race_id: UUID4
+    attempts: int
+    error: Optional[str]
+    sail_nr: Optional[int]
+    progress: int
+    total: Optional[int]
+
+    created_at: datetime.datetime
+    updated_at: datetime.datetime
+
+    class Config:
+        orm_mode = True
+        use_enum_values = True
@@ -0,0 +1,20 @@
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+from api.schemas.competitor import CompetitorOut
+
+
+class StandingOut(BaseModel):
+    """Representing the standing of a competitor in the results that is returned to
+    a user as schema."""
+
+    rank: int
+    total_points: int
+    net_points: int
+    # the points of every race in order of the race number, null without a finish
+    race_points: List[Optional[int]]
+    competitor: CompetitorOut
+
+    class Config:
+        orm_mode = True
@@ -0,0 +1,206 @@
+import datetime
+import gc
+import logging
+import os
+import random
+import signal
+import socket
+import time
+from typing import Dict, Set
+
+import uvicorn
+
+from api.config import settings
+from api.metrics import Gauge
+
+logger = logging.getLogger("uvicorn.error")
+
+# backends whose loaded model survives a fork, the others load per worker
+FORK_SAFE_BACKENDS = {"tflite"}
+
+
+def read_memory(pid: int) -> Dict[str, int]:
+    """Return the resident, proportional and shared memory of a process in bytes."""
+    memory = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as smaps:
+            for line in smaps:
+                key, _, value = line.partition(":")
+                if key in ("Rss", "Pss", "Shared_Clean", "Shared_Dirty"):
+                    memory[key] = int(value.split()[0]) * 1024
+    except OSError:
+        return {}
+
+    return {
+        "rss": memory.get("Rss", 0),
+        "pss": memory.get("Pss", 0),
+        "shared": memory.get("Shared_Clean", 0) + memory.get("Shared_Dirty", 0),
+    }
+
+
+process_memory = Gauge(
+    "process_memory_bytes",
+    "Resident, proportional and shared memory of the serving process.",
+    ("kind",),
+    function=lambda: read_memory(os.getpid()),
+)
+
+
+def preload():
+    """Load what the workers only read before forking, so they share its pages."""
+    from api import recognizer_provider as model_provider
+    from api.database import SessionLocal, engine
+    from api.models import Competition
+    from api.services import sail_numbers
+
+    if model_provider.backend.name in FORK_SAFE_BACKENDS:
+        model_provider.get()
+    else:
+        logger.info(f"{model_provider.backend.name} model is loaded per worker")
+
+    db = SessionLocal()
+    try:
+        current = db.query(Competition.id).filter(
+            Competition.end_date >= datetime.date.today()
+        )
+        # the workers rebuild the trees whose competitors changed since
+        for (competition_id,) in current:
+            sail_numbers.closest(db, competition_id, "")
+    finally:
+        db.close()
+
+    # workers must not share the connections of the parent
+    engine.dispose()
+    # keep the preloaded objects out of the garbage collector, so collections in
+    # the workers do not write to and thereby copy their pages
+    gc.freeze()
+
+
+class Arbiter:
+    """Represent the parent process of the pre-forked api workers.
+
+    The parent binds the socket and preloads the app, then forks the workers
+    and replaces every worker that exits, either by crashing or after serving
+    its maximum number of requests.
+    """
+
+    def __init__(self, app, workers: int):
+        # configures the logging of the parent as well
+        self.config = uvicorn.Config(app)
+        self.workers = workers
+        self.children: Set[int] = set()
+        self.stopping = False
+
+    def bind(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((settings.fastapi_app, settings.fastapi_port))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+
+        return sock
+
+    def spawn(self, sock: socket.socket):
+        pid = os.fork()
+        if pid:
+            self.children.add(pid)
+            return
+
+        # the worker handles its signals itself through uvicorn
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+        max_requests = settings.server_max_requests
+        if max_requests:
+            # spread the recycling of the workers over time
+            max_requests += random.randint(0, max_requests // 10)
+            self.config.limit_max_requests = max_requests
+
+        server = uvicorn.Server(self.config)
+        try:
+            server.run(sockets=[sock])
+        finally:
+            os._exit(0)
+
+    def report_memory(self):
+        for pid in list(self.children):
+            memory = read_memory(pid)
+            if memory:
+                logger.info(
+                    f"worker {pid} memory: "
+                    + ", ".join(
+                        f"{key} {value / 2**20:.1f} MiB"
+                        for key, value in memory.items()
+                    )
+                )
+
+    def stop(self, *_):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        sock = self.bind()
+        preload()
+
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        for _ in range(self.workers):
+            self.spawn(sock)
+        logger.info(f"started {self.workers} workers on port {settings.fastapi_port}")
+
+        # the memory is reported from this loop, the parent stays without
+        # threads that could hold a lock at the moment a worker is forked
+        report_at = time.monotonic() + settings.server_memory_report_seconds
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+
+            if not pid:
+                if (
+                    settings.server_memory_report_seconds
+                    and not self.stopping
+                    and time.monotonic() >= report_at
+                ):
+                    self.report_memory()
+                    report_at = time.monotonic() + settings.server_memory_report_seconds
+                time.sleep(0.1)
+                continue
+
+            self.children.discard(pid)
+            if not self.stopping:
+                logger.info(f"worker {pid} exited with {status}, starting a new one")
+                self.spawn(sock)
+            elif self.children:
+                self.kill_after_timeout()
+
+        sock.close()
+
+    def kill_after_timeout(self):
+        deadline = time.monotonic() + settings.server_graceful_timeout
+        while self.children and time.monotonic() < deadline:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+            if pid:
+                self.children.discard(pid)
+            else:
+                time.sleep(0.1)
+
+        for pid in list(self.children):
+            logger.info(f"worker {pid} did not stop in time, killing it")
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+
+def serve(app, workers: int):
+    """Serve the app with the given number of pre-forked worker processes."""
+    Arbiter(app, workers).run()
@@ -1,7 +1,59 @@
+from api.services.archive import get_capture_time, ingest_archive, read_entries
+from api.services.counters import next_finish_points, next_race_nr
+from api.services.finishes import parse_finish_order, record_finish_order
+from api.services.jobs import (
+    claim_job,
+    enqueue_upload,
+    process_job,
+    remove_spool_file,
+    run_worker,
+    spool_files_of_races,
+    start_workers,
+)
+from api.services.leaderboard import refresh_leaderboard
+from api.services.pool import executor, run_in_pool
 from api.services.position import (
+    Recognition,
+    RecognitionCache,
+    add_finish,
+    batcher,
     combine_digits_to_full_number,
+    decode_image,
     get_countours,
+    predict_digits,
+    predict_sail_number,
+    recognition_cache,
+    recognize_digits,
+    recognize_image,
+    recognize_images,
+    recognize_number,
+    record_finishes,
+    scale_image,
     seperate_number_into_digits,
     sort_contours,
     update_ranking,
 )
+from api.services.quality import UnusableImage, check_digit_count, check_image
+from api.services.sail_number import BKTree, SailNumberIndex, sail_numbers
+from api.services.scoring import (
+    add_points,
+    count_discards,
+    discard_count,
+    lock_competitors,
+    rescore_competition,
+)
+from api.services.sequence import (
+    ctc_greedy_decode,
+    locate_number,
+    prepare_sequence,
+    recognize_sequences,
+    sequence_batcher,
+)
+from api.services.stream import FinishDetector
+from api.services.video import (
+    distinct_frames,
+    fold_detections,
+    frame_hash,
+    ingest_video,
+    sample_frames,
+)
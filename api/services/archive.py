@@ -0,0 +1,184 @@
+import os
+import tarfile
+import zipfile
+from itertools import islice
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from pydantic import UUID4
+from sqlalchemy.orm import Session
+
+from api import logger, settings
+from api.models import Race
+from api.services.position import decode_image, recognize_images, record_finishes
+from api.services.sail_number import sail_numbers
+
+# extensions of the archive entries recognized as finish photos
+PHOTO_EXTENSIONS = (".jpg", ".jpeg")
+# exif tags of the capture time and its fraction of a second
+DATE_TIME = 0x0132
+EXIF_IFD = 0x8769
+DATE_TIME_ORIGINAL = 0x9003
+SUB_SEC_TIME_ORIGINAL = 0x9291
+
+
+def read_ifd(tiff: bytes, offset: int, byte_order: str) -> dict:
+    """Return the ascii and long values of an exif directory by their tag."""
+    values = {}
+    if offset + 2 > len(tiff):
+        return values
+
+    count = int.from_bytes(tiff[offset : offset + 2], byte_order)
+    for i in range(count):
+        entry = tiff[offset + 2 + 12 * i : offset + 14 + 12 * i]
+        if len(entry) < 12:
+            break
+        tag = int.from_bytes(entry[0:2], byte_order)
+        kind = int.from_bytes(entry[2:4], byte_order)
+        length = int.from_bytes(entry[4:8], byte_order)
+
+        # ascii strings longer than four bytes are stored at an offset
+        if kind == 2:
+            if length > 4:
+                start = int.from_bytes(entry[8:12], byte_order)
+                value = tiff[start : start + length]
+            else:
+                value = entry[8 : 8 + length]
+            values[tag] = value.split(b"\0", 1)[0].decode("ascii", "replace")
+        elif kind == 4:
+            values[tag] = int.from_bytes(entry[8:12], byte_order)
+
+    return values
+
+
+def get_capture_time(contents: bytes) -> Optional[str]:
+    """Return the exif capture time of a jpeg as sortable text, if it has one.
+
+    The time is returned as ``YYYY:MM:DD HH:MM:SS.fraction`` so photos taken in
+    a burst within the same second still sort in the order they were taken.
+    """
+    offset = 2
+    while offset + 4 <= len(contents) and contents[offset] == 0xFF:
+        marker = contents[offset + 1]
+        length = int.from_bytes(contents[offset + 2 : offset + 4], "big")
+        # the exif segment comes before the image data
+        if marker == 0xDA:
+            return None
+        if marker == 0xE1 and contents[offset + 4 : offset + 10] == b"Exif\0\0":
+            tiff = contents[offset + 10 : offset + 2 + length]
+            byte_order = "little" if tiff[:2] == b"II" else "big"
+
+            ifd = read_ifd(tiff, int.from_bytes(tiff[4:8], byte_order), byte_order)
+            exif = {}
+            if EXIF_IFD in ifd:
+                exif = read_ifd(tiff, ifd[EXIF_IFD], byte_order)
+
+            captured = exif.get(DATE_TIME_ORIGINAL) or ifd.get(DATE_TIME)
+            if not captured:
+                return None
+            return f"{captured}.{exif.get(SUB_SEC_TIME_ORIGINAL, '').strip()}"
+        offset += 2 + length
+
+    return None
+
+
+def is_photo(name: str) -> bool:
+    """Return whether the archive entry name is a finish photo."""
+    basename = os.path.basename(name)
+    return not basename.startswith(".") and name.lower().endswith(PHOTO_EXTENSIONS)
+
+
+def read_entries(path: str) -> Tuple[Optional[int], Iterator[Tuple[str, bytes]]]:
+    """Return the number of photos in a zip or tar archive and an iterator of
+    their names and contents.
+
+    Entries are read one at a time in archive order, tar archives as a stream so
+    compressed ones are never decompressed as a whole, which leaves their number
+    unknown. Entries larger than the configured limit are skipped.
+    """
+    limit = settings.archive_max_entry_bytes
+
+    if zipfile.is_zipfile(path):
+        archive = zipfile.ZipFile(path)
+        infos = []
+        for info in archive.infolist():
+            if info.is_dir() or not is_photo(info.filename):
+                continue
+            if info.file_size > limit:
+                logger.info(f"skipping {info.filename}, it is too large")
+                continue
+            infos.append(info)
+
+        def entries():
+            with archive:
+                for info in infos:
+                    with archive.open(info) as entry:
+                        yield info.filename, entry.read(limit)
+
+        return len(infos), entries()
+
+    if tarfile.is_tarfile(path):
+
+        def entries():
+            with tarfile.open(path, mode="r|*") as archive:
+                for member in archive:
+                    if not member.isfile() or not is_photo(member.name):
+                        continue
+                    if member.size > limit:
+                        logger.info(f"skipping {member.name}, it is too large")
+                        continue
+                    yield member.name, archive.extractfile(member).read()
+
+        return None, entries()
+
+    raise ValueError("the file is not a zip or tar archive")
+
+
+def ingest_archive(
+    race_id: UUID4,
+    path: str,
+    db: Session,
+    report: Optional[Callable[[int, Optional[int]], None]] = None,
+) -> List[int]:
+    """Add the finishes on the photos of an archive to the race.
+
+    Photos are recognized in batches while the archive is read, only their
+    capture times and matched sail numbers are kept. The finishes are recorded
+    in the order the photos were taken, in a single transaction. ``report`` is
+    called with the number of processed photos and the total after each batch.
+    """
+    race: Race = db.query(Race).get(race_id)
+    total, entries = read_entries(path)
+
+    detections = []
+    processed = 0
+    while True:
+        batch = list(islice(entries, settings.archive_batch_size))
+        if not batch:
+            break
+
+        images, keys = [], []
+        for index, (name, contents) in enumerate(batch, start=processed):
+            try:
+                images.append(decode_image(contents))
+            except ValueError:
+                logger.info(f"skipping {name}, it could not be decoded")
+                continue
+            # photos without a capture time go last, in archive order
+            captured = get_capture_time(contents)
+            keys.append((captured is None, captured or "", index))
+
+        for key, recognition in zip(keys, recognize_images(images)):
+            if not recognition.number:
+                continue
+            matches = sail_numbers.closest(db, race.competition_id, recognition.number)
+            if matches:
+                detections.append((key, int(matches[0])))
+
+        processed += len(batch)
+        if report:
+            report(processed, total)
+
+    finishes = [sail_nr for _, sail_nr in sorted(detections)]
+    logger.info(f"finishes detected in archive: {finishes}")
+
+    return record_finishes(race_id, finishes, db)
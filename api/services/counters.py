@@ -0,0 +1,36 @@
+"""Allocation of the numbers that have to be unique under concurrent requests.
+
+Instead of counting the existing rows, which concurrent transactions do not see,
+a counter on the parent row is incremented in place. The row stays locked until
+the transaction ends, so concurrent allocations get consecutive numbers.
+"""
+import sqlalchemy as sa
+from pydantic import UUID4
+from sqlalchemy.orm import Session
+
+from api.models import Competition, Race
+
+
+def next_finish_points(db: Session, race_id: UUID4, count: int = 1) -> int:
+    """Return the points of the next finish of a race, or of the first of the
+    next ``count`` finishes, which get consecutive points."""
+    last = db.execute(
+        sa.update(Race)
+        .where(Race.id == race_id)
+        .values(finish_count=Race.finish_count + count)
+        .returning(Race.finish_count)
+        .execution_options(synchronize_session=False)
+    ).scalar_one()
+
+    return last - count + 1
+
+
+def next_race_nr(db: Session, competition_id: UUID4) -> int:
+    """Return the number of the next race of a competition."""
+    return db.execute(
+        sa.update(Competition)
+        .where(Competition.id == competition_id)
+        .values(race_count=Competition.race_count + 1)
+        .returning(Competition.race_count)
+        .execution_options(synchronize_session=False)
+    ).scalar_one()
@@ -0,0 +1,140 @@
+"""Entry of the whole finish order of a race at once.
+
+Clubs often have the finish order already, from a tally sheet or another
+scoring program. The sail numbers are validated against the competition in one
+query, the race counter is advanced by all of them in one update, the positions
+are inserted in one statement and the competition is rescored once, so a large
+fleet is entered in a few round trips instead of several per finish.
+"""
+import csv
+import io
+from collections import Counter
+from typing import List
+
+import sqlalchemy as sa
+from pydantic import UUID4
+from sqlalchemy.orm import Session
+
+from api.database import run_transaction
+from api.metrics import stage_seconds
+from api.models import Competitor, Position, Race
+from api.services.counters import next_finish_points
+from api.services.scoring import lock_competitors, rescore_competition
+
+# name of the column holding the sail numbers in a csv with a header
+SAIL_NR_COLUMN = "sail_nr"
+# insert the finishes of the sail numbers in their order, the first of them
+# getting the points given
+INSERT_FINISHES = sa.text(
+    """
+    INSERT INTO position (id, race_id, sail_nr, points)
+    SELECT gen_random_uuid(),
+           :race_id,
+           finish.sail_nr,
+           :first_points + finish.place - 1
+    FROM unnest(CAST(:sail_nrs AS bigint[])) WITH ORDINALITY AS finish(sail_nr, place)
+    RETURNING *
+    """
+)
+
+
+def parse_finish_order(contents: bytes) -> List[int]:
+    """Return the sail numbers of a csv in their finishing order.
+
+    The sail numbers are read from the ``sail_nr`` column, or the first column
+    when the first row is not a header. Empty rows are skipped.
+    """
+    rows = [
+        row
+        for row in csv.reader(io.StringIO(contents.decode("utf-8-sig")))
+        if any(cell.strip() for cell in row)
+    ]
+
+    column = 0
+    if rows and not rows[0][0].strip().isdigit():
+        header = [cell.strip().lower() for cell in rows.pop(0)]
+        if SAIL_NR_COLUMN in header:
+            column = header.index(SAIL_NR_COLUMN)
+
+    sail_nrs = []
+    for line, row in enumerate(rows, start=1):
+        value = row[column].strip() if column < len(row) else ""
+        if not value.isdigit():
+            raise ValueError(f"row {line} has no sail number: {','.join(row)}")
+        sail_nrs.append(int(value))
+
+    return sail_nrs
+
+
+def record_finish_order(
+    race_id: UUID4, sail_nrs: List[int], db: Session
+) -> List[Position]:
+    """Add the finishes of the sail numbers in their order after the finishes
+    already in the race and update the points, in a single transaction.
+
+    Raises ``ValueError`` without adding any finish when a sail number is
+    repeated, not in the competition or already finished the race. Returns the
+    added positions.
+    """
+    if not sail_nrs:
+        raise ValueError("the finish order is empty")
+
+    repeated = [sail_nr for sail_nr, count in Counter(sail_nrs).items() if count > 1]
+    if repeated:
+        raise ValueError(
+            f"sail numbers finished more than once: {', '.join(map(str, repeated))}"
+        )
+
+    def record() -> List[Position]:
+        race: Race = db.query(Race).get(race_id)
+        # all of them are rescored, locked first to see the finishes committed
+        lock_competitors(db, race.competition_id)
+
+        # every sail number with its finish in the race if any, in one query
+        rows = (
+            db.query(Competitor.sail_nr, Position.id)
+            .outerjoin(
+                Position,
+                sa.and_(
+                    Position.race_id == race.id,
+                    Position.sail_nr == Competitor.sail_nr,
+                ),
+            )
+            .filter(
+                Competitor.competition_id == race.competition_id,
+                Competitor.sail_nr.in_(sail_nrs),
+            )
+            .all()
+        )
+        known = {sail_nr for sail_nr, _ in rows}
+
+        unknown = [sail_nr for sail_nr in sail_nrs if sail_nr not in known]
+        if unknown:
+            raise ValueError(
+                f"no competitors with sail numbers {', '.join(map(str, unknown))} "
+                "in the competition"
+            )
+        finished = [sail_nr for sail_nr, position_id in rows if position_id]
+        if finished:
+            raise ValueError(
+                f"sail numbers {', '.join(map(str, finished))} already finished "
+                "the race"
+            )
+
+        first_points = next_finish_points(db, race.id, len(sail_nrs))
+        positions = db.execute(
+            INSERT_FINISHES,
+            {
+                "race_id": race.id,
+                "first_points": first_points,
+                "sail_nrs": sail_nrs,
+            },
+        ).all()
+
+        # most of the fleet finished, one statement rescores all of them
+        rescore_competition(db, race.competition_id)
+
+        return positions
+
+    with stage_seconds.time("database"):
+        return run_transaction(db, record)
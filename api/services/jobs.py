@@ -0,0 +1,274 @@
+import datetime
+import os
+import shutil
+import threading
+import uuid
+from typing import BinaryIO, Callable, List, Optional
+
+import sqlalchemy as sa
+from pydantic import UUID4
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from api import logger
+from api.config import settings
+from api.database import SessionLocal
+from api.metrics import Gauge
+from api.models import Job, JobKind, JobStatus
+from api.profiling import current_profile, profile_job
+from api.services.archive import ingest_archive
+from api.services.position import update_ranking
+from api.services.quality import UnusableImage
+from api.services.video import ingest_video
+
+# size of the chunks uploads are copied to the spool directory in
+SPOOL_CHUNK_SIZE = 1 << 20
+
+
+def count_backlog() -> dict:
+    """Return the number of queued and running jobs."""
+    db = SessionLocal()
+    try:
+        counts = dict(
+            db.query(Job.status, sa.func.count(Job.id))
+            .filter(Job.status.in_([JobStatus.QUEUED, JobStatus.RUNNING]))
+            .group_by(Job.status)
+        )
+    finally:
+        db.close()
+
+    return {
+        status.value: counts.get(status, 0)
+        for status in (JobStatus.QUEUED, JobStatus.RUNNING)
+    }
+
+
+job_backlog = Gauge(
+    "job_backlog",
+    "Number of upload jobs waiting or being processed.",
+    ("status",),
+    function=count_backlog,
+)
+
+
+def enqueue_upload(
+    race_id: UUID4, upload: BinaryIO, kind: JobKind, suffix: str, db: Session
+) -> Job:
+    """Spool the uploaded file in chunks and queue a job processing it."""
+    job_id = uuid.uuid4()
+    path = os.path.join(settings.spool_directory, f"{job_id}{suffix}")
+
+    # write to a temporary file first so a worker never reads a partial upload
+    os.makedirs(settings.spool_directory, exist_ok=True)
+    with open(f"{path}.tmp", "wb") as spool_file:
+        shutil.copyfileobj(upload, spool_file, SPOOL_CHUNK_SIZE)
+    os.replace(f"{path}.tmp", path)
+
+    profile = current_profile.get()
+    job = Job(
+        id=job_id,
+        kind=kind,
+        race_id=race_id,
+        path=path,
+        profile_id=profile.id if profile is not None else None,
+    )
+    db.add(job)
+    db.commit()
+
+    return job
+
+
+def remove_spool_file(path: str):
+    """Remove the spooled upload of a job that will not run again."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def spool_files_of_races(db: Session, race_ids: List[UUID4]) -> List[str]:
+    """Return the spooled uploads of the jobs of the races, to remove once the
+    races are deleted along with their jobs."""
+    return [
+        path
+        for (path,) in db.query(Job.path).filter(
+            Job.race_id.in_(race_ids),
+            Job.status.in_([JobStatus.QUEUED, JobStatus.RUNNING]),
+        )
+    ]
+
+
+def fail_abandoned_jobs(db: Session):
+    """Mark the jobs whose worker lost its lease on their last attempt as failed.
+
+    A job whose processing crashes or kills its worker would be taken over
+    again and again otherwise.
+    """
+    jobs = db.execute(
+        sa.update(Job)
+        .where(
+            Job.status == JobStatus.RUNNING,
+            Job.lease_expires_at < sa.func.now(),
+            Job.attempts >= settings.job_max_attempts,
+        )
+        .values(
+            status=JobStatus.FAILED,
+            error="the worker stopped while processing the job",
+        )
+        .returning(Job.id, Job.path)
+        .execution_options(synchronize_session=False)
+    ).all()
+    db.commit()
+
+    for job_id, path in jobs:
+        logger.info(f"job {job_id} failed, its worker stopped on the last attempt")
+        remove_spool_file(path)
+
+
+def claim_job(db: Session) -> Optional[Job]:
+    """Take the oldest queued job or a job whose worker lost its lease.
+
+    Rows locked by other workers are skipped, so any number of workers in any
+    number of processes or hosts can claim jobs concurrently. Jobs out of
+    attempts are failed instead of being taken over.
+    """
+    fail_abandoned_jobs(db)
+
+    job: Job = (
+        db.query(Job)
+        .filter(
+            or_(
+                Job.status == JobStatus.QUEUED,
+                sa.and_(
+                    Job.status == JobStatus.RUNNING,
+                    Job.lease_expires_at < sa.func.now(),
+                    Job.attempts < settings.job_max_attempts,
+                ),
+            )
+        )
+        .order_by(Job.created_at)
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+
+    if not job:
+        return None
+
+    job.status = JobStatus.RUNNING
+    job.attempts += 1
+    job.lease_expires_at = sa.func.now() + datetime.timedelta(
+        seconds=settings.job_lease_seconds
+    )
+    db.commit()
+
+    return job
+
+
+def process_photo(job: Job, db: Session):
+    """Record the finish recognized on the job's photo."""
+    with open(job.path, "rb") as spool_file:
+        contents = spool_file.read()
+
+    job.sail_nr = update_ranking(job.race_id, contents, db)
+
+
+def progress_reporter(job: Job, db: Session) -> Callable[[int, Optional[int]], None]:
+    """Return the callback publishing the progress of a long running job."""
+
+    def report(processed: int, total: Optional[int]):
+        # keep the lease while the upload is processed and publish the progress
+        job.progress = processed
+        job.total = total
+        job.lease_expires_at = sa.func.now() + datetime.timedelta(
+            seconds=settings.job_lease_seconds
+        )
+        db.commit()
+
+    return report
+
+
+def process_video(job: Job, db: Session):
+    """Record the finishes recognized in the job's video."""
+    job.progress = 0
+    ingest_video(job.race_id, job.path, db, progress_reporter(job, db))
+
+
+def process_archive(job: Job, db: Session):
+    """Record the finishes recognized on the photos of the job's archive."""
+    job.progress = 0
+    ingest_archive(job.race_id, job.path, db, progress_reporter(job, db))
+
+
+# the function processing a job by its kind
+PROCESSORS = {
+    JobKind.PHOTO: process_photo,
+    JobKind.VIDEO: process_video,
+    JobKind.ARCHIVE: process_archive,
+}
+
+
+def process_job(job: Job, db: Session):
+    """Record the finishes of the job's upload and update the job state."""
+    try:
+        with profile_job(job.profile_id):
+            PROCESSORS[job.kind](job, db)
+    except UnusableImage as e:
+        # retrying cannot make the photo usable
+        db.rollback()
+        logger.info(f"job {job.id} rejected: {e}")
+
+        job.error = str(e)
+        job.status = JobStatus.FAILED
+        db.commit()
+        remove_spool_file(job.path)
+        return
+    except Exception as e:
+        db.rollback()
+        logger.exception(f"job {job.id} failed")
+
+        job.error = str(e)
+        if job.attempts < settings.job_max_attempts:
+            job.status = JobStatus.QUEUED
+        else:
+            job.status = JobStatus.FAILED
+        db.commit()
+        if job.status == JobStatus.FAILED:
+            remove_spool_file(job.path)
+        return
+
+    job.status = JobStatus.DONE
+    job.error = None
+    db.commit()
+    remove_spool_file(job.path)
+
+
+def run_worker(stop: threading.Event):
+    """Process jobs until the stop event is set."""
+    while not stop.is_set():
+        db = SessionLocal()
+        try:
+            job = claim_job(db)
+            if job:
+                process_job(job, db)
+        except Exception:
+            logger.exception("job worker failed")
+            job = None
+        finally:
+            db.close()
+
+        if not job:
+            stop.wait(settings.job_poll_interval)
+
+
+def start_workers(count: int, stop: threading.Event) -> List[threading.Thread]:
+    """Start job workers as daemon threads of the current process."""
+    workers = [
+        threading.Thread(
+            target=run_worker, args=(stop,), name=f"job-worker-{i}", daemon=True
+        )
+        for i in range(count)
+    ]
+    for worker in workers:
+        worker.start()
+
+    return workers
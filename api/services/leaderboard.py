@@ -0,0 +1,119 @@
+"""The precomputed results of the competitions.
+
+The standings of a competition are refreshed in the transaction changing its
+finishes or competitors, so the results are read with a single indexed query.
+Only the standings whose rank or points changed are written, a finish usually
+moves a few competitors, so refreshing a large fleet stays cheap.
+Competitors are ranked by their net points. Ties are broken by their results
+without the discarded ones, best first, and then by their latest races, as in
+appendix A8 of the racing rules. Competitors without any finish rank last.
+"""
+import sqlalchemy as sa
+from pydantic import UUID4
+from sqlalchemy.orm import Session
+
+from api.metrics import stage_seconds
+
+# lock the standings of a competition for the rest of the transaction
+LOCK_STANDINGS = sa.text(
+    "SELECT pg_advisory_xact_lock(hashtextextended(:competition_id ::text, 0))"
+)
+# drop the standings of the competitors no longer in the competition
+DELETE_STANDINGS = sa.text(
+    """
+    DELETE FROM standing
+    WHERE standing.competition_id = :competition_id
+      AND NOT EXISTS (
+          SELECT FROM competitor
+          WHERE competitor.id = standing.competitor_id
+            AND competitor.competition_id = :competition_id
+      )
+    """
+)
+# write the standings of the current scores of the competitors, leaving the
+# unchanged ones alone
+UPSERT_STANDINGS = sa.text(
+    """
+    WITH results AS (
+        SELECT competitor.id AS competitor_id,
+               competitor.total_points,
+               competitor.net_points,
+               count(position.points) AS finishes,
+               coalesce(
+                   array_agg(position.points ORDER BY race.race_nr)
+                       FILTER (WHERE race.id IS NOT NULL),
+                   '{}'
+               ) AS race_points,
+               coalesce(
+                   array_agg(position.points ORDER BY position.points)
+                       FILTER (WHERE position.points IS NOT NULL),
+                   '{}'
+               ) AS sorted_points,
+               array_agg(position.points ORDER BY race.race_nr DESC) AS latest_points,
+               cardinality(competitor.discarded_points) AS discards
+        FROM competitor
+        LEFT JOIN race ON race.competition_id = competitor.competition_id
+        LEFT JOIN position
+          ON position.race_id = race.id AND position.sail_nr = competitor.sail_nr
+        WHERE competitor.competition_id = :competition_id
+        GROUP BY competitor.id
+    )
+    INSERT INTO standing (
+        id,
+        competition_id,
+        competitor_id,
+        rank,
+        total_points,
+        net_points,
+        race_points
+    )
+    SELECT gen_random_uuid(),
+           :competition_id,
+           competitor_id,
+           RANK() OVER (
+               ORDER BY finishes = 0,
+                        net_points,
+                        sorted_points[1:finishes - discards],
+                        latest_points
+           ),
+           total_points,
+           net_points,
+           race_points
+    FROM results
+    ON CONFLICT (competitor_id) DO UPDATE
+    SET competition_id = excluded.competition_id,
+        rank = excluded.rank,
+        total_points = excluded.total_points,
+        net_points = excluded.net_points,
+        race_points = excluded.race_points,
+        updated_at = now()
+    WHERE (
+        standing.competition_id,
+        standing.rank,
+        standing.total_points,
+        standing.net_points,
+        standing.race_points
+    ) IS DISTINCT FROM (
+        excluded.competition_id,
+        excluded.rank,
+        excluded.total_points,
+        excluded.net_points,
+        excluded.race_points
+    )
+    """
+)
+
+
+def refresh_leaderboard(db: Session, competition_id: UUID4):
+    """Refresh the standings of a competition from the scores of its
+    competitors, not committed.
+
+    The standings are locked until the transaction ends, so concurrent refreshes
+    wait for each other instead of conflicting. The lock is an advisory one, as
+    allocating a race number holds the lock of the competition row.
+    """
+    parameters = {"competition_id": competition_id}
+    with stage_seconds.time("leaderboard"):
+        db.execute(LOCK_STANDINGS, parameters)
+        db.execute(DELETE_STANDINGS, parameters)
+        db.execute(UPSERT_STANDINGS, parameters)
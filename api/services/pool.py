@@ -0,0 +1,30 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from api.config import settings
+from api.profiling import current_profile
+
+# bounded pool running the cpu-bound recognition and the blocking database work,
+# so the event loop stays free for cheap requests
+executor = ThreadPoolExecutor(
+    max_workers=settings.worker_pool_size, thread_name_prefix="recognition"
+)
+
+
+async def run_in_pool(func, *args, **kwargs):
+    """Run a blocking function in the worker pool and await its result.
+
+    The function runs in a copy of the context of the caller, like with
+    ``asyncio.to_thread``.
+    """
+    loop = asyncio.get_running_loop()
+    # sample the pool thread as well when the request is profiled
+    profile = current_profile.get()
+    if profile is not None:
+        func = profile.wrap(func)
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        executor, functools.partial(context.run, func, *args, **kwargs)
+    )
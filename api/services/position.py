@@ -1,47 +1,287 @@
-import difflib
-from typing import List
+import hashlib
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import List, NamedTuple, Optional, Tuple
 
 import cv2
 import numpy as np
-from fastapi import UploadFile
 from pydantic import UUID4
-from sqlalchemy import desc
 from sqlalchemy.orm import Session
 
-from api import logger, model
+from api import logger, model_provider, recognizer_provider, settings
+from api.database import run_transaction
+from api.metrics import Counter, Gauge, Histogram, stage_seconds
 from api.models import Competition, Competitor, Position, Race
+from api.services.counters import next_finish_points
+from api.services.leaderboard import refresh_leaderboard
+from api.services.quality import UnusableImage, check_digit_count, check_image
+from api.services.sail_number import sail_numbers
+from api.services.scoring import add_points, count_discards, lock_competitors
+
+
+class InferenceBatcher:
+    """Collect digit crops of concurrent requests and predict them in one batch.
+
+    Crops are queued by ``submit`` and picked up by a single daemon thread, which
+    waits at most ``window`` seconds (or until ``max_batch_size`` crops are
+    collected) before running one ``predict`` call for all of them. Each caller
+    gets back a future resolving to its own slice of the predictions.
+    """
+
+    def __init__(self, predict, window: float, max_batch_size: int):
+        self._predict = predict
+        self._window = window
+        self._max_batch_size = max_batch_size
+        self._queue: "queue.Queue[Tuple[np.ndarray, Future]]" = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        """Return the number of requests waiting for their predictions."""
+        return self._queue.qsize()
+
+    def submit(self, digits: np.ndarray) -> Future:
+        """Queue the digits for prediction and return a future of the predictions."""
+        future = Future()
+
+        if len(digits) == 0:
+            future.set_result(np.empty((0, 10), dtype=np.float32))
+            return future
+
+        self._ensure_started()
+        self._queue.put((digits, future))
+
+        return future
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="inference-batcher", daemon=True
+                )
+                self._thread.start()
+
+    def _collect(self) -> List[Tuple[np.ndarray, Future]]:
+        batch = [self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self._window
+
+        while size < self._max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[0])
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+
+            try:
+                digits = np.concatenate([digits for digits, _ in batch])
+                inference_batch_size.observe(value=len(digits))
+                with stage_seconds.time("inference"):
+                    predictions = self._predict(digits)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for digits, future in batch:
+                future.set_result(predictions[offset : offset + len(digits)])
+                offset += len(digits)
+
+
+batcher = InferenceBatcher(
+    predict=model_provider.predict,
+    window=settings.inference_batch_window_ms / 1000,
+    max_batch_size=settings.inference_batch_size,
+)
+
+inference_batch_size = Histogram(
+    "inference_batch_size",
+    "Number of digits predicted per model call.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512),
+)
+inference_pending = Gauge(
+    "inference_pending_requests",
+    "Number of requests waiting for the inference batcher.",
+    function=lambda: batcher.pending,
+)
+contours_total = Counter(
+    "recognition_contours_total",
+    "Number of contours found in images and kept as digits.",
+    ("kind",),
+)
+
+
+def predict_digits(digits: np.ndarray) -> np.ndarray:
+    """Return the class probabilities of the digits, batched with other requests."""
+    return batcher.submit(digits).result()
+
+
+# size of the image the contours are searched on
+CONTOUR_IMAGE_SIZE = (400, 400)
+# size of a single digit as expected by the model
+DIGIT_SIZE = 28
+# bounds of a digit-like bounding box, heights relative to the image height
+MIN_DIGIT_HEIGHT = 0.05
+MAX_DIGIT_HEIGHT = 0.9
+MIN_DIGIT_ASPECT = 0.1
+MAX_DIGIT_ASPECT = 1.2
+# digits of one sail number are about as tall as the tallest of them
+MIN_RELATIVE_DIGIT_HEIGHT = 0.6
+
+
+# jpeg start of frame markers, which hold the image dimensions
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7}
+JPEG_SOF_MARKERS |= {0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# decode flags of the reduced grayscale decoding by their reduction factor
+REDUCED_GRAYSCALE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+    (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    (2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+)
+
+
+def get_jpeg_size(buffer) -> Optional[Tuple[int, int]]:
+    """Return the width and height of a jpeg from its header, if it can be found."""
+    data = memoryview(buffer)
+    offset = 2
+    while offset + 9 <= len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        # padding and markers without a payload
+        if marker == 0xFF:
+            offset += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            offset += 2
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            height = int.from_bytes(data[offset + 5 : offset + 7], "big")
+            width = int.from_bytes(data[offset + 7 : offset + 9], "big")
+            return width, height
+        offset += 2 + int.from_bytes(data[offset + 2 : offset + 4], "big")
+
+    return None
+
+
+@stage_seconds.timed("decode")
+def decode_image(contents) -> np.ndarray:
+    """Decode an uploaded jpeg to a grayscale image no smaller than needed.
+
+    The upload buffer is wrapped without copying and, when the header tells that
+    the image is large enough, decoded at a reduced scale straight to grayscale.
+    """
+    nparr = np.frombuffer(contents, np.uint8)
+
+    flag = cv2.IMREAD_GRAYSCALE
+    size = get_jpeg_size(nparr)
+    if size is not None:
+        for factor, reduced_flag in REDUCED_GRAYSCALE_FLAGS:
+            if min(size) // factor >= min(CONTOUR_IMAGE_SIZE):
+                flag = reduced_flag
+                break
+
+    image = cv2.imdecode(nparr, flag)
+    if image is None:
+        raise ValueError("the image could not be decoded")
+
+    return image
+
+
+def scale_image(image) -> np.ndarray:
+    """Return the image in grayscale at the size the contours are searched on."""
+    image = cv2.resize(image, CONTOUR_IMAGE_SIZE, interpolation=cv2.INTER_AREA)
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    return image
 
 
 def get_countours(image):
-    image = cv2.resize(image, (400, 400))
-    image = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-    image = cv2.adaptiveThreshold(image, 255, 1, 1, 11, 2)
-    contours, _ = cv2.findContours(image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+    with stage_seconds.time("threshold"):
+        # images scaled for the quality gate already are
+        if image.shape != CONTOUR_IMAGE_SIZE[::-1]:
+            image = scale_image(image)
+        image = cv2.adaptiveThreshold(image, 255, 1, 1, 11, 2)
+
+    with stage_seconds.time("contours"):
+        contours, _ = cv2.findContours(image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
 
     return contours, image
 
 
-def sort_contours(contours, padding=10):
-    digit_boxes = []
-    for contour in contours:
-        x, y, w, h = cv2.boundingRect(contour)
-        digit_boxes.append((x - padding, y - padding, w + padding, h + padding))
+@stage_seconds.timed("filter")
+def sort_contours(contours, shape=CONTOUR_IMAGE_SIZE, padding=10) -> np.ndarray:
+    """Return the padded boxes of the digit-like contours ordered from left to right.
 
-    digit_boxes.sort(key=lambda r: r[0])
+    Boxes are returned as an ``(N, 4)`` array of ``x0, y0, x1, y1`` clipped to the
+    image, after dropping boxes whose size or aspect ratio cannot be a digit.
+    """
+    if len(contours) == 0:
+        return np.empty((0, 4), dtype=np.int64)
 
-    return digit_boxes
+    boxes = np.array([cv2.boundingRect(contour) for contour in contours])
+    x, y, w, h = boxes.T
+    height, width = shape[:2]
 
+    keep = (
+        (h >= MIN_DIGIT_HEIGHT * height)
+        & (h <= MAX_DIGIT_HEIGHT * height)
+        & (w >= MIN_DIGIT_ASPECT * h)
+        & (w <= MAX_DIGIT_ASPECT * h)
+    )
+    if keep.any():
+        keep &= h >= MIN_RELATIVE_DIGIT_HEIGHT * h[keep].max()
 
-def seperate_number_into_digits(image, digit_boxes):
-    digits = []
-    for contour in digit_boxes:
-        _image = image[
-            contour[1] : contour[1] + contour[3], contour[0] : contour[0] + contour[2]
-        ]
-        _image = cv2.resize(_image, (28, 28), interpolation=cv2.INTER_AREA)
-        digits.append(_image)
+    contours_total.inc("found", amount=len(contours))
+    contours_total.inc("kept", amount=int(keep.sum()))
+
+    x, y, w, h = x[keep], y[keep], w[keep], h[keep]
+    digit_boxes = np.stack(
+        [
+            np.clip(x - padding, 0, width),
+            np.clip(y - padding, 0, height),
+            np.clip(x + w + padding, 0, width),
+            np.clip(y + h + padding, 0, height),
+        ],
+        axis=1,
+    )
 
-    return np.array(digits)
+    return digit_boxes[np.argsort(digit_boxes[:, 0], kind="stable")]
+
+
+@stage_seconds.timed("crop")
+def seperate_number_into_digits(image, digit_boxes: np.ndarray) -> np.ndarray:
+    """Return the ``(N, 28, 28)`` batch of digits cut out of the image.
+
+    Every box is area-resampled by ``cv2.resize`` straight from a view of the
+    image into the preallocated batch, the digits the model was trained on.
+    """
+    digits = np.empty((len(digit_boxes), DIGIT_SIZE, DIGIT_SIZE), dtype=np.uint8)
+    for digit, (x0, y0, x1, y1) in zip(digits, digit_boxes):
+        cv2.resize(
+            image[y0:y1, x0:x1],
+            (DIGIT_SIZE, DIGIT_SIZE),
+            dst=digit,
+            interpolation=cv2.INTER_AREA,
+        )
+
+    return digits
 
 
 def combine_digits_to_full_number(predictions):
@@ -53,85 +293,283 @@ def combine_digits_to_full_number(predictions):
     return predicted_number
 
 
-def update_ranking(race_id: UUID4, file: UploadFile, db: Session):
-    """Handle calculating the total and net points."""
-    race: Race = db.query(Race).get(race_id)
+class Recognition(NamedTuple):
+    """Representing the sail number recognized on an image."""
+
+    number: str
+    # the class probabilities of every digit of the number
+    probabilities: np.ndarray
+    # the reason the image was rejected by the quality gate, if it was
+    rejected: Optional[str] = None
+
+
+def rejected_recognition(reason: str) -> Recognition:
+    """Return the empty recognition of an image rejected by the quality gate."""
+    return Recognition("", np.empty((0, 10), dtype=np.float32), reason)
+
+
+class RecognitionCache:
+    """Keep the latest recognitions by image content and model version.
+
+    Uploads of the same photo hit the cache instead of running the pipeline
+    again, the least recently used recognition is evicted once it is full.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        self._entries: "OrderedDict[str, Recognition]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(contents) -> str:
+        """Return the cache key of the image contents for the current model."""
+        digest = hashlib.sha256(contents).hexdigest()
+        return f"{recognizer_provider.version}:{digest}"
+
+    def get(self, key: str) -> Optional[Recognition]:
+        """Return the cached recognition of the key, if any."""
+        with self._lock:
+            recognition = self._entries.get(key)
+            if recognition is None:
+                self.misses += 1
+                return None
 
-    # convert bytes to opencv image object
-    contents = file.file.read()
-    nparr = np.fromstring(contents, np.uint8)
-    image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-    # define the contours of image
-    contours, image = get_countours(image=image)
-    # put contours in right order
-    digit_boxes = sort_contours(contours)
-    # define array of the single digits of number
-    digits = seperate_number_into_digits(image, digit_boxes)
-    # generate a prediction on all digits
-    predictions = model.predict(digits)
-    # combine predicted digits into whole number
-    predicted_number = combine_digits_to_full_number(predictions)
-    # get all possibilities of sail numbers for this competition
-    possibilities = [
-        str(competitor.sail_nr)
-        for competitor in db.query(Competitor.sail_nr)
-        .filter(Competition.id == race.competition_id)
-        .all()
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return recognition
+
+    def put(self, key: str, recognition: Recognition):
+        """Cache the recognition, evicting the least recently used one if full."""
+        with self._lock:
+            self._entries[key] = recognition
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Return the hit and miss counters of the cache."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self),
+            "max_size": self.max_size,
+        }
+
+
+recognition_cache = RecognitionCache(max_size=settings.recognition_cache_size)
+
+recognition_cache_requests = Counter(
+    "recognition_cache_requests_total",
+    "Number of recognition cache lookups by result.",
+    ("result",),
+    function=lambda: {
+        "hit": recognition_cache.hits,
+        "miss": recognition_cache.misses,
+    },
+)
+
+
+def recognize_image(contents: bytes) -> Recognition:
+    """Return the recognition of the jpeg image, from the cache when possible.
+
+    Raises ``UnusableImage`` when the image was rejected by the quality gate.
+    """
+    key = recognition_cache.key(contents)
+    recognition = recognition_cache.get(key)
+    if recognition is None:
+        # convert bytes to a grayscale opencv image object
+        image = decode_image(contents)
+        recognition = recognize_images([image])[0]
+        recognition_cache.put(key, recognition)
+
+    if recognition.rejected:
+        raise UnusableImage(recognition.rejected)
+
+    return recognition
+
+
+def recognize_images(images: List[np.ndarray]) -> List[Recognition]:
+    """Return the recognitions of decoded images by the configured recognizer.
+
+    Images failing the quality gate are not recognized, they get an empty
+    recognition with the reason of their rejection.
+    """
+    recognitions: List[Optional[Recognition]] = [None] * len(images)
+    accepted, scaled = [], []
+    for i, image in enumerate(images):
+        # scaled once, for the quality gate and the contour search
+        with stage_seconds.time("threshold"):
+            scaled_image = scale_image(image)
+        rejection = check_image(scaled_image)
+        if rejection:
+            recognitions[i] = rejected_recognition(rejection)
+        else:
+            accepted.append(i)
+            scaled.append(scaled_image)
+
+    if settings.recognizer == "crnn":
+        from api.services.sequence import recognize_sequences
+
+        aspects = [images[i].shape[1] / images[i].shape[0] for i in accepted]
+        accepted_recognitions = recognize_sequences(scaled, aspects)
+    else:
+        accepted_recognitions = recognize_digits(scaled)
+
+    for i, recognition in zip(accepted, accepted_recognitions):
+        recognitions[i] = recognition
+
+    return recognitions
+
+
+def recognize_digits(images: List[np.ndarray]) -> List[Recognition]:
+    """Return the recognitions of decoded images, predicting all digits at once."""
+    digits, rejections = [], []
+    for image in images:
+        # define the contours of image
+        contours, image = get_countours(image=image)
+        # put contours in right order and cut out the single digits
+        digit_boxes = sort_contours(contours)
+        rejections.append(check_digit_count(len(digit_boxes)))
+        if rejections[-1]:
+            digit_boxes = digit_boxes[:0]
+        digits.append(seperate_number_into_digits(image, digit_boxes))
+
+    if not digits:
+        return []
+
+    predictions = predict_digits(np.concatenate(digits))
+    offsets = np.cumsum([0] + [len(image_digits) for image_digits in digits])
+
+    return [
+        Recognition(
+            combine_digits_to_full_number(predictions[start:end]),
+            predictions[start:end],
+            rejection,
+        )
+        for start, end, rejection in zip(offsets[:-1], offsets[1:], rejections)
     ]
 
-    logger.info(f"predicted number: {predicted_number}")
 
-    # get the clossest match
-    if predicted_number not in possibilities:
-        matches = difflib.get_close_matches(predicted_number, possibilities)
-        if matches:
-            predicted_number = difflib.get_close_matches(
-                predicted_number, possibilities
-            )[0]
+def recognize_number(contents: bytes) -> str:
+    """Return the sail number recognized on the jpeg image."""
+    return recognize_image(contents).number
 
-    logger.info(f"clossest number: {predicted_number}")
 
-    new_position = Position(
-        race_id=race_id,
-        sail_nr=predicted_number,
-    )
+def predict_sail_number(
+    contents: bytes, db: Session, competition_id: Optional[UUID4] = None
+) -> Tuple[str, List[str]]:
+    """Return the recognized sail number and the closest known sail numbers."""
+    predicted_number = recognize_number(contents)
 
-    if not (
-        db.query(Position)
+    if competition_id is None:
+        competition: Competition = db.query(Competition).first()
+        competition_id = competition.id if competition else None
+
+    closest_numbers = sail_numbers.closest(db, competition_id, predicted_number)
+
+    return predicted_number, closest_numbers
+
+
+def add_finish(
+    race: Race, sail_nr: int, db: Session, discards: Optional[int] = None
+) -> bool:
+    """Add the finish of the sail number to the race and update the points.
+
+    ``discards`` is the number of discarded results in the competition of the
+    race, counted if not given. The changes are flushed but not committed,
+    returns whether a new finish was added.
+    """
+    # locked, so concurrent finishes of the competitor are added one by one
+    competitor: Competitor = (
+        db.query(Competitor)
         .filter(
-            Position.race_id == new_position.race_id,
-            Position.sail_nr == new_position.sail_nr,
+            Competitor.competition_id == race.competition_id,
+            Competitor.sail_nr == sail_nr,
         )
+        .with_for_update(key_share=True)
+        .first()
+    )
+    if not competitor:
+        logger.info(f"no competitor with sail number {sail_nr} in the competition")
+        return False
+
+    # checked once the competitor is locked, to see finishes committed meanwhile
+    if (
+        db.query(Position)
+        .filter(Position.race_id == race.id, Position.sail_nr == sail_nr)
         .first()
     ):
-        new_points = (
-            db.query(Position).filter(Position.race_id == new_position.race_id).count()
-            + 1
-        )
+        return False
 
-        new_position.points = new_points
+    if discards is None:
+        discards = count_discards(db, race.competition_id)
 
-        competitor: Competitor = (
-            db.query(Competitor)
-            .filter(Competitor.sail_nr == new_position.sail_nr)
-            .first()
-        )
-        competitor.total_points += new_points
+    new_points = next_finish_points(db, race.id)
+
+    db.add(Position(race_id=race.id, sail_nr=sail_nr, points=new_points))
+    add_points(competitor, new_points, discards)
+
+    db.flush()
+
+    return True
+
+
+def record_finishes(race_id: UUID4, finishes: List[int], db: Session) -> List[int]:
+    """Add the ordered finishes to the race in a single transaction.
 
-        db.add(new_position)
+    Returns the sail numbers of the newly added finishes.
+    """
 
-        subtract_total = competitor.total_points - competitor.net_points
-        race_count = db.query(Race).count()
-        if (race_count > 0) and (race_count % 4 == 0):
-            subtract_count = int(race_count / 4)
+    def record() -> List[int]:
+        race: Race = db.query(Race).get(race_id)
+        lock_competitors(db, race.competition_id, finishes)
+        # counted once locked, a rescore for a new race may have committed meanwhile
+        discards = count_discards(db, race.competition_id)
+
+        added = [
+            sail_nr for sail_nr in finishes if add_finish(race, sail_nr, db, discards)
+        ]
+        if added:
+            refresh_leaderboard(db, race.competition_id)
+
+        return added
+
+    with stage_seconds.time("database"):
+        return run_transaction(db, record)
+
+
+def update_ranking(race_id: UUID4, contents: bytes, db: Session) -> Optional[int]:
+    """Handle calculating the total and net points.
+
+    Returns the sail number the finish was recorded for, if one was recognized.
+    """
+    race: Race = db.query(Race).get(race_id)
+
+    predicted_number = recognize_number(contents)
+
+    logger.info(f"predicted number: {predicted_number}")
+
+    # get the clossest match among the sail numbers of this competition
+    matches = sail_numbers.closest(db, race.competition_id, predicted_number)
+    if not matches:
+        logger.info(f"no sail number close to {predicted_number}")
+        return
+    predicted_number = matches[0]
+
+    logger.info(f"clossest number: {predicted_number}")
 
-            all_competitor_positions: List[Position] = competitor.positions.order_by(
-                desc(Position.points)
-            ).all()
-            subtract_total = 0
-            for i in range(subtract_count):
-                subtract_total += all_competitor_positions[i].points
+    def record():
+        if add_finish(race, int(predicted_number), db):
+            refresh_leaderboard(db, race.competition_id)
 
-        competitor.net_points = competitor.total_points - subtract_total
+    with stage_seconds.time("database"):
+        run_transaction(db, record)
 
-        db.commit()
+    return int(predicted_number)
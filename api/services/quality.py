@@ -0,0 +1,76 @@
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from api.config import settings
+from api.metrics import Counter, stage_seconds
+
+# reasons a photo is rejected for by the quality gate
+BLURRY = "blurry"
+DARK = "dark"
+OVEREXPOSED = "overexposed"
+LOW_CONTRAST = "low_contrast"
+NO_DIGITS = "no_digits"
+
+# messages of the rejection reasons
+REJECTION_MESSAGES = {
+    BLURRY: "the image is too blurry",
+    DARK: "the image is too dark",
+    OVEREXPOSED: "the image is overexposed",
+    LOW_CONTRAST: "the image has too little contrast",
+    NO_DIGITS: "no digits were found on the image",
+}
+
+rejected_total = Counter(
+    "recognition_rejected_total",
+    "Number of images rejected before inference by reason.",
+    ("reason",),
+)
+
+
+class UnusableImage(ValueError):
+    """Raised when an image was rejected by the quality gate."""
+
+    def __init__(self, reason: str):
+        super().__init__(REJECTION_MESSAGES[reason])
+        self.reason = reason
+
+
+@stage_seconds.timed("quality")
+def check_image(image: np.ndarray) -> Optional[str]:
+    """Return the reason to reject the grayscale image, if any.
+
+    The image has to be scaled to the size the contours are searched on, so the
+    sharpness threshold does not depend on the photo resolution.
+    """
+    mean, deviation = (float(value[0, 0]) for value in cv2.meanStdDev(image))
+
+    if settings.quality_min_brightness and mean < settings.quality_min_brightness:
+        return reject(DARK)
+    if settings.quality_max_brightness and mean > settings.quality_max_brightness:
+        return reject(OVEREXPOSED)
+    if settings.quality_min_contrast and deviation < settings.quality_min_contrast:
+        return reject(LOW_CONTRAST)
+
+    if settings.quality_min_sharpness:
+        sharpness = cv2.Laplacian(image, cv2.CV_64F).var()
+        if sharpness < settings.quality_min_sharpness:
+            return reject(BLURRY)
+
+    return None
+
+
+def check_digit_count(count: int) -> Optional[str]:
+    """Return the reason to reject an image with the number of digit-like
+    contours, if any."""
+    if count < settings.quality_min_digits:
+        return reject(NO_DIGITS)
+
+    return None
+
+
+def reject(reason: str) -> str:
+    """Count the rejection and return its reason."""
+    rejected_total.inc(reason)
+    return reason
@@ -0,0 +1,151 @@
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import sqlalchemy as sa
+from pydantic import UUID4
+from sqlalchemy.orm import Session
+
+from api.config import settings
+from api.metrics import stage_seconds
+from api.models import Competitor
+
+
+def edit_distance(a: str, b: str) -> int:
+    """Return the levenshtein distance between two strings."""
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start=1):
+        current = [i]
+        for j, char_b in enumerate(b, start=1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (char_a != char_b),
+                )
+            )
+        previous = current
+
+    return previous[-1]
+
+
+class BKTree:
+    """Represent a burkhard-keller tree answering nearest edit distance lookups.
+
+    Every child is stored under its distance to the parent, so by the triangle
+    inequality a search only descends into children whose distance lies within
+    the search radius around the distance of the query to the parent.
+    """
+
+    def __init__(self, words: Iterable[str] = ()):
+        self._root: Optional[Tuple[str, Dict[int, tuple]]] = None
+        self._size = 0
+
+        for word in words:
+            self.add(word)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, word: str):
+        """Add a word to the tree."""
+        if self._root is None:
+            self._root = (word, {})
+            self._size += 1
+            return
+
+        node_word, children = self._root
+        while True:
+            distance = edit_distance(word, node_word)
+            if distance == 0:
+                return
+            if distance not in children:
+                children[distance] = (word, {})
+                self._size += 1
+                return
+            node_word, children = children[distance]
+
+    def search(self, word: str, max_distance: int) -> List[Tuple[int, str]]:
+        """Return the words within the distance ordered by distance and word."""
+        if self._root is None:
+            return []
+
+        matches = []
+        candidates = [self._root]
+        while candidates:
+            node_word, children = candidates.pop()
+            distance = edit_distance(word, node_word)
+            if distance <= max_distance:
+                matches.append((distance, node_word))
+
+            candidates.extend(
+                child
+                for child_distance, child in children.items()
+                if distance - max_distance <= child_distance <= distance + max_distance
+            )
+
+        return sorted(matches)
+
+
+class SailNumberIndex:
+    """Cache a bk-tree of the sail numbers of every competition.
+
+    The tree of a competition is built on the first lookup. Every lookup reads
+    a fingerprint of the sail numbers of the competition, so a tree cached
+    before competitors changed, in this or any other process, is rebuilt.
+    """
+
+    def __init__(self, max_distance: int):
+        self.max_distance = max_distance
+
+        self._trees: Dict[UUID4, Tuple[tuple, BKTree]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(db: Session, competition_id: UUID4) -> tuple:
+        """Return the number and summed hashes of the sail numbers of a competition."""
+        return tuple(
+            db.query(
+                sa.func.count(Competitor.sail_nr),
+                sa.func.coalesce(
+                    sa.func.sum(
+                        sa.func.hashtextextended(
+                            sa.cast(Competitor.sail_nr, sa.Text), 0
+                        )
+                    ),
+                    0,
+                ),
+            )
+            .filter(Competitor.competition_id == competition_id)
+            .one()
+        )
+
+    def _tree(self, db: Session, competition_id: UUID4) -> BKTree:
+        fingerprint = self.fingerprint(db, competition_id)
+        cached = self._trees.get(competition_id)
+        if cached is None or cached[0] != fingerprint:
+            with self._lock:
+                cached = self._trees.get(competition_id)
+                if cached is None or cached[0] != fingerprint:
+                    sail_numbers = db.query(Competitor.sail_nr).filter(
+                        Competitor.competition_id == competition_id
+                    )
+                    tree = BKTree(str(sail_nr) for sail_nr, in sail_numbers)
+                    cached = self._trees[competition_id] = (fingerprint, tree)
+
+        return cached[1]
+
+    @stage_seconds.timed("matching")
+    def closest(
+        self, db: Session, competition_id: UUID4, number: str, n: int = 3
+    ) -> List[str]:
+        """Return up to n sail numbers of the competition closest to the number."""
+        matches = self._tree(db, competition_id).search(number, self.max_distance)
+        return [sail_nr for _, sail_nr in matches[:n]]
+
+    def invalidate(self, competition_id: Optional[UUID4]):
+        """Drop the cached tree of the competition, freeing it right away."""
+        with self._lock:
+            self._trees.pop(competition_id, None)
+
+
+sail_numbers = SailNumberIndex(max_distance=settings.sail_number_max_distance)
@@ -0,0 +1,138 @@
+"""Incremental scoring of the competitors of a competition.
+
+The net points of a competitor are their total points without their worst
+``races // 4`` results, counting the races of their own competition. Next to
+the totals every competitor keeps the points of their discarded results as a
+min-heap, so a new finish updates total and net points in ``O(log k)`` without
+reading their other positions. ``rescore_competition`` rebuilds all of them
+from the positions in a single statement and yields the same numbers.
+"""
+import heapq
+from typing import Iterable, Optional
+
+import sqlalchemy as sa
+from pydantic import UUID4
+from sqlalchemy.orm import Session
+
+from api.metrics import stage_seconds
+from api.models import Competitor, Race
+from api.services.leaderboard import refresh_leaderboard
+
+# every this many races of a competition one more result is discarded
+RACES_PER_DISCARD = 4
+
+# recompute the scores of all competitors of a competition in one statement, the
+# worst results are picked by their rank among the results of each competitor
+RESCORE_COMPETITION = sa.text(
+    """
+    WITH discards AS (
+        SELECT count(*) / :races_per_discard AS discards
+        FROM race
+        WHERE race.competition_id = :competition_id
+    ),
+    ranked AS (
+        SELECT position.sail_nr,
+               position.points,
+               ROW_NUMBER() OVER (
+                   PARTITION BY position.sail_nr ORDER BY position.points DESC
+               ) AS worst
+        FROM position
+        JOIN race ON race.id = position.race_id
+        WHERE race.competition_id = :competition_id
+    ),
+    scores AS (
+        SELECT competitor.id AS competitor_id,
+               coalesce(sum(ranked.points), 0) AS total,
+               coalesce(sum(ranked.points) FILTER (WHERE worst <= discards), 0)
+                   AS discarded_total,
+               coalesce(
+                   array_agg(ranked.points ORDER BY ranked.points)
+                       FILTER (WHERE worst <= discards),
+                   '{}'
+               ) AS discarded
+        FROM competitor
+        CROSS JOIN discards
+        LEFT JOIN ranked ON ranked.sail_nr = competitor.sail_nr
+        WHERE competitor.competition_id = :competition_id
+        GROUP BY competitor.id
+    )
+    UPDATE competitor
+    SET total_points = scores.total,
+        net_points = scores.total - scores.discarded_total,
+        discarded_points = scores.discarded
+    FROM scores
+    WHERE competitor.id = scores.competitor_id
+    """
+)
+
+
+def discard_count(race_count: int) -> int:
+    """Return the number of discarded results after the number of races."""
+    return race_count // RACES_PER_DISCARD
+
+
+def count_discards(db: Session, competition_id: UUID4) -> int:
+    """Return the number of discarded results in a competition."""
+    race_count = db.query(Race).filter(Race.competition_id == competition_id).count()
+    return discard_count(race_count)
+
+
+def add_points(competitor: Competitor, points: int, discards: int):
+    """Add the points of a new result to the score of the competitor.
+
+    The discarded results are the ``discards`` worst ones, the new result
+    replaces the best of them when it is worse.
+    """
+    discarded = list(competitor.discarded_points or [])
+    competitor.total_points += points
+
+    if len(discarded) < discards:
+        heapq.heappush(discarded, points)
+    else:
+        if discarded and points > discarded[0]:
+            # the best discarded result counts again
+            points = heapq.heapreplace(discarded, points)
+        competitor.net_points += points
+
+    competitor.discarded_points = discarded
+
+
+def lock_competitors(
+    db: Session, competition_id: UUID4, sail_nrs: Optional[Iterable[int]] = None
+):
+    """Lock the competitors of a competition with the sail numbers, or all of
+    them, until the transaction ends.
+
+    Competitors are always locked in the same order, so transactions locking
+    several of them do not deadlock on each other. The lock still lets other
+    transactions reference them, like the standings being rebuilt.
+    """
+    query = db.query(Competitor.id).filter(Competitor.competition_id == competition_id)
+    if sail_nrs is not None:
+        query = query.filter(Competitor.sail_nr.in_(set(sail_nrs)))
+
+    query.order_by(Competitor.id).with_for_update(key_share=True).all()
+
+
+def rescore_competition(db: Session, competition_id: UUID4) -> int:
+    """Recompute the scores and standings of all competitors of a competition
+    from their positions, not committed.
+
+    The competitors are locked before their positions are read, so finishes
+    added at the same time are not lost. Returns the number of competitors.
+    """
+    lock_competitors(db, competition_id)
+
+    with stage_seconds.time("rescore"):
+        result = db.execute(
+            RESCORE_COMPETITION,
+            {
+                "competition_id": competition_id,
+                "races_per_discard": RACES_PER_DISCARD,
+            },
+        )
+    refresh_leaderboard(db, competition_id)
+    # the loaded competitors of the competition are stale now
+    db.expire_all()
+
+    return result.rowcount
@@ -0,0 +1,157 @@
+"""Whole-number recognition by a sequence model with CTC decoding.
+
+Instead of segmenting the sail number into digits, the thresholded region of
+the number is resized to a fixed line and read by a CRNN in one forward pass,
+which keeps touching and broken digits readable. The model is built and
+trained with ``python -m api.crnn``.
+"""
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from api import sequence_provider, settings
+from api.metrics import stage_seconds
+from api.services.position import (
+    CONTOUR_IMAGE_SIZE,
+    MAX_DIGIT_HEIGHT,
+    MIN_DIGIT_HEIGHT,
+    MIN_RELATIVE_DIGIT_HEIGHT,
+    InferenceBatcher,
+    Recognition,
+    get_countours,
+    rejected_recognition,
+)
+from api.services.quality import check_digit_count
+
+# size of the number line as expected by the model
+SEQUENCE_HEIGHT = 32
+SEQUENCE_WIDTH = 128
+# class of the ctc blank, following the ten digits
+BLANK = 10
+
+sequence_batcher = InferenceBatcher(
+    predict=sequence_provider.predict,
+    window=settings.inference_batch_window_ms / 1000,
+    max_batch_size=settings.inference_batch_size,
+)
+
+
+@stage_seconds.timed("filter")
+def locate_number(
+    contours, shape=CONTOUR_IMAGE_SIZE, padding=10
+) -> Tuple[np.ndarray, int]:
+    """Return the padded ``x0, y0, x1, y1`` box around the digit-like contours
+    and their number.
+
+    Unlike ``sort_contours`` the width of a contour is not limited, so digits
+    touching each other stay in the box. Without any candidate the whole image
+    is returned.
+    """
+    height, width = shape[:2]
+    if len(contours) == 0:
+        return np.array([0, 0, width, height]), 0
+
+    boxes = np.array([cv2.boundingRect(contour) for contour in contours])
+    x, y, w, h = boxes.T
+
+    keep = (h >= MIN_DIGIT_HEIGHT * height) & (h <= MAX_DIGIT_HEIGHT * height)
+    if not keep.any():
+        return np.array([0, 0, width, height]), 0
+    keep &= h >= MIN_RELATIVE_DIGIT_HEIGHT * h[keep].max()
+
+    x, y, w, h = x[keep], y[keep], w[keep], h[keep]
+    box = np.array(
+        [
+            max(x.min() - padding, 0),
+            max(y.min() - padding, 0),
+            min((x + w).max() + padding, width),
+            min((y + h).max() + padding, height),
+        ]
+    )
+
+    return box, len(x)
+
+
+@stage_seconds.timed("crop")
+def crop_number(image, box: np.ndarray, aspect: float = 1.0) -> np.ndarray:
+    """Return the box of the image as a ``(32, 128)`` line, left aligned.
+
+    The crop is scaled to the line height, restoring the aspect ratio of the
+    photo it was squared from by ``aspect`` (its width over its height), and
+    padded with background on the right.
+    """
+    x0, y0, x1, y1 = box
+    crop = image[y0:y1, x0:x1]
+    width = crop.shape[1] * aspect * SEQUENCE_HEIGHT / max(crop.shape[0], 1)
+    width = int(round(width))
+    width = min(max(width, 1), SEQUENCE_WIDTH)
+
+    line = np.zeros((SEQUENCE_HEIGHT, SEQUENCE_WIDTH), dtype=np.uint8)
+    line[:, :width] = cv2.resize(
+        crop, (width, SEQUENCE_HEIGHT), interpolation=cv2.INTER_AREA
+    )
+
+    return line
+
+
+def prepare_sequence(image, aspect: Optional[float] = None) -> Tuple[np.ndarray, int]:
+    """Return the number line of a decoded image as read by the model and the
+    number of digit-like contours it was located by.
+
+    ``aspect`` is the width over the height of the photo, if the image was
+    already scaled to the contour image size.
+    """
+    if aspect is None:
+        aspect = image.shape[1] / image.shape[0]
+    contours, image = get_countours(image=image)
+    box, count = locate_number(contours)
+
+    return crop_number(image, box, aspect), count
+
+
+def ctc_greedy_decode(probabilities: np.ndarray) -> List[Tuple[str, np.ndarray]]:
+    """Decode ``(N, T, 11)`` time step probabilities into numbers.
+
+    The most likely class is taken at every time step, then repeated classes are
+    merged and blanks dropped. Returns every number with the digit probabilities
+    of the time steps it was read from.
+    """
+    best = probabilities.argmax(-1)
+    changed = np.ones(best.shape, dtype=bool)
+    changed[:, 1:] = best[:, 1:] != best[:, :-1]
+    emitted = changed & (best != BLANK)
+
+    decoded = []
+    for steps, classes, step_probabilities in zip(emitted, best, probabilities):
+        indices = np.flatnonzero(steps)
+        number = "".join(str(digit) for digit in classes[indices])
+        decoded.append((number, step_probabilities[indices, :BLANK]))
+
+    return decoded
+
+
+def recognize_sequences(
+    images: List[np.ndarray], aspects: Optional[List[float]] = None
+) -> List[Recognition]:
+    """Return the recognitions of decoded images, reading all numbers at once.
+
+    ``aspects`` are the aspect ratios of the photos of already scaled images.
+    """
+    lines, rejections = [], []
+    for image, aspect in zip(images, aspects or [None] * len(images)):
+        line, count = prepare_sequence(image, aspect)
+        rejections.append(check_digit_count(count))
+        if not rejections[-1]:
+            lines.append(line)
+
+    if not lines:
+        return [rejected_recognition(rejection) for rejection in rejections]
+
+    probabilities = sequence_batcher.submit(np.stack(lines)).result()
+    decoded = iter(ctc_greedy_decode(probabilities))
+
+    return [
+        rejected_recognition(rejection) if rejection else Recognition(*next(decoded))
+        for rejection in rejections
+    ]
@@ -0,0 +1,32 @@
+from typing import Optional, Set
+
+
+class FinishDetector:
+    """Confirm the finish of a sail number recognized in consecutive frames.
+
+    A single frame may be misread, so a finish only counts once the same sail
+    number was matched in enough frames in a row, and only once per stream.
+    """
+
+    def __init__(self, confirm_frames: int):
+        self.confirm_frames = confirm_frames
+        self.confirmed: Set[int] = set()
+
+        self._candidate: Optional[int] = None
+        self._streak = 0
+
+    def observe(self, sail_nr: Optional[int]) -> bool:
+        """Observe the sail number of a frame, returns whether it is a new finish."""
+        if sail_nr != self._candidate:
+            self._candidate = sail_nr
+            self._streak = 0
+
+        if sail_nr is None:
+            return False
+
+        self._streak += 1
+        if self._streak >= self.confirm_frames and sail_nr not in self.confirmed:
+            self.confirmed.add(sail_nr)
+            return True
+
+        return False
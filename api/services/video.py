@@ -0,0 +1,119 @@
+from collections import Counter
+from itertools import islice
+from typing import Callable, Iterator, List, Optional
+
+import cv2
+import numpy as np
+from pydantic import UUID4
+from sqlalchemy.orm import Session
+
+from api import logger
+from api.config import settings
+from api.models import Race
+from api.services.position import recognize_images, record_finishes
+from api.services.sail_number import sail_numbers
+
+
+def sample_frames(path: str, sample_fps: float) -> Iterator[np.ndarray]:
+    """Yield grayscale frames of the video at about the sample rate.
+
+    Frames in between are only grabbed, not decoded into images.
+    """
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError("the video could not be opened")
+
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+        step = max(1, round(fps / sample_fps))
+
+        index = 0
+        while capture.grab():
+            if index % step == 0:
+                ok, frame = capture.retrieve()
+                if ok:
+                    yield cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            index += 1
+    finally:
+        capture.release()
+
+
+def frame_hash(image: np.ndarray) -> int:
+    """Return the 64 bit difference hash of a grayscale frame."""
+    small = cv2.resize(image, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = np.packbits(small[:, 1:] > small[:, :-1])
+    return int.from_bytes(bits.tobytes(), "big")
+
+
+def distinct_frames(
+    frames: Iterator[np.ndarray], max_distance: int
+) -> Iterator[np.ndarray]:
+    """Yield the frames that differ from the last yielded frame.
+
+    Frames whose hash is within the hamming distance of the previous distinct
+    frame show the same scene and are skipped before any recognition.
+    """
+    previous = None
+    for frame in frames:
+        current = frame_hash(frame)
+        if previous is not None and bin(previous ^ current).count("1") <= max_distance:
+            continue
+        previous = current
+        yield frame
+
+
+def fold_detections(detections: List[int], min_detections: int) -> List[int]:
+    """Return the detected sail numbers in order of first detection.
+
+    Sail numbers detected fewer times than the minimum are dropped as noise.
+    """
+    counts = Counter(detections)
+    return [
+        sail_nr
+        for sail_nr in dict.fromkeys(detections)
+        if counts[sail_nr] >= min_detections
+    ]
+
+
+def ingest_video(
+    race_id: UUID4,
+    path: str,
+    db: Session,
+    report: Optional[Callable[[int, Optional[int]], None]] = None,
+) -> List[int]:
+    """Record the finishes recognized in a video of the finish line.
+
+    Frames are recognized in batches, so memory stays bounded no matter how
+    long the video is. ``report`` is called with the number of recognized
+    frames after each batch, the total is not known up front. Returns the sail
+    numbers of the added finishes.
+    """
+    race: Race = db.query(Race).get(race_id)
+
+    frames = distinct_frames(
+        sample_frames(path, settings.video_sample_fps),
+        settings.video_frame_hash_distance,
+    )
+
+    detections = []
+    processed = 0
+    while True:
+        batch = list(islice(frames, settings.video_batch_size))
+        if not batch:
+            break
+
+        for recognition in recognize_images(batch):
+            if not recognition.number:
+                continue
+            matches = sail_numbers.closest(db, race.competition_id, recognition.number)
+            if matches:
+                detections.append(int(matches[0]))
+
+        processed += len(batch)
+        if report:
+            report(processed, None)
+
+    finishes = fold_detections(detections, settings.video_min_detections)
+    logger.info(f"finishes detected in video: {finishes}")
+
+    return record_finishes(race_id, finishes, db)
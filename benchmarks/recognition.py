@@ -0,0 +1,283 @@
+"""Benchmark the speed and accuracy of the sail number recognition pipeline.
+
+Run from the repository root, e.g.::
+
+    python -m benchmarks.recognition --count 300 --output bench.json
+    python -m benchmarks.recognition --compare bench.json --output new.json
+    python -m benchmarks.recognition --recognizer crnn --compare bench.json
+"""
+import argparse
+import json
+import platform
+import subprocess
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from api import model_provider, sequence_provider
+from api.services.position import (
+    combine_digits_to_full_number,
+    decode_image,
+    get_countours,
+    seperate_number_into_digits,
+    sort_contours,
+)
+from api.services.sequence import crop_number, ctc_greedy_decode, locate_number
+from benchmarks.synthetic import generate_images
+
+# the stages of the pipeline of every recognizer in order of execution
+STAGES = {
+    "digits": (
+        "decode",
+        "get_countours",
+        "sort_contours",
+        "seperate_number_into_digits",
+        "predict",
+        "combine_digits_to_full_number",
+    ),
+    "crnn": (
+        "decode",
+        "get_countours",
+        "locate_number",
+        "crop_number",
+        "predict",
+        "ctc_greedy_decode",
+    ),
+}
+# the model of every recognizer
+PROVIDERS = {"digits": model_provider, "crnn": sequence_provider}
+# resolutions of the synthetic photos, from thumbnails to 12 MP phone photos
+RESOLUTIONS = ((640, 480), (1920, 1080), (4032, 3024))
+
+
+def summarize(seconds: List[float]) -> Dict[str, float]:
+    """Return the latency percentiles in milliseconds."""
+    milliseconds = np.asarray(seconds) * 1000
+    return {
+        "p50_ms": float(np.percentile(milliseconds, 50)),
+        "p95_ms": float(np.percentile(milliseconds, 95)),
+        "p99_ms": float(np.percentile(milliseconds, 99)),
+        "mean_ms": float(milliseconds.mean()),
+    }
+
+
+def digit_accuracy(predicted: str, truth: str) -> float:
+    """Return the share of ground truth digits predicted at their position."""
+    correct = sum(p == t for p, t in zip(predicted, truth))
+    return correct / max(len(truth), len(predicted))
+
+
+def recognize_digits(image, marks: List[float]) -> Tuple[str, int]:
+    """Run the digit pipeline stage by stage, marking the end of every stage.
+
+    Returns the predicted number and the number of segmented digits.
+    """
+    contours, image = get_countours(image=image)
+    marks.append(time.perf_counter())
+    digit_boxes = sort_contours(contours)
+    marks.append(time.perf_counter())
+    digits = seperate_number_into_digits(image, digit_boxes)
+    marks.append(time.perf_counter())
+    predictions = model_provider.predict(digits) if len(digits) else []
+    marks.append(time.perf_counter())
+    predicted = combine_digits_to_full_number(predictions)
+    marks.append(time.perf_counter())
+
+    return predicted, len(digit_boxes)
+
+
+def recognize_sequence(image, marks: List[float]) -> Tuple[str, None]:
+    """Run the crnn pipeline stage by stage, marking the end of every stage."""
+    aspect = image.shape[1] / image.shape[0]
+    contours, image = get_countours(image=image)
+    marks.append(time.perf_counter())
+    box, _ = locate_number(contours)
+    marks.append(time.perf_counter())
+    line = crop_number(image, box, aspect)
+    marks.append(time.perf_counter())
+    probabilities = sequence_provider.predict(line[None])
+    marks.append(time.perf_counter())
+    predicted, _ = ctc_greedy_decode(np.asarray(probabilities))[0]
+    marks.append(time.perf_counter())
+
+    return predicted, None
+
+
+def run(count: int, seed: int, recognizer: str = "digits", **distortions) -> dict:
+    """Run the pipeline stage by stage on synthetic photos and collect the results."""
+    PROVIDERS[recognizer].warm_up()
+    recognize = recognize_sequence if recognizer == "crnn" else recognize_digits
+    stages = STAGES[recognizer]
+
+    timings = defaultdict(list)
+    totals = defaultdict(list)
+    accuracy = defaultdict(list)
+    exact = defaultdict(list)
+    kept_digits = []
+    segmented = []
+
+    images = list(generate_images(count, RESOLUTIONS, seed, **distortions))
+
+    started = time.perf_counter()
+    for synthetic in images:
+        resolution = "x".join(str(side) for side in synthetic.resolution)
+        marks = [time.perf_counter()]
+
+        image = decode_image(synthetic.contents)
+        marks.append(time.perf_counter())
+        predicted, digit_count = recognize(image, marks)
+
+        for stage, start, end in zip(stages, marks[:-1], marks[1:]):
+            timings[stage].append(end - start)
+        totals[resolution].append(marks[-1] - marks[0])
+        totals["all"].append(marks[-1] - marks[0])
+        accuracy[resolution].append(digit_accuracy(predicted, synthetic.number))
+        accuracy["all"].append(digit_accuracy(predicted, synthetic.number))
+        exact[resolution].append(predicted == synthetic.number)
+        exact["all"].append(predicted == synthetic.number)
+        if digit_count is not None:
+            kept_digits.append(digit_count)
+            segmented.append(digit_count == len(synthetic.number))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "recognizer": recognizer,
+        "images": count,
+        "seed": seed,
+        "distortions": distortions,
+        "images_per_second": count / elapsed,
+        # the crnn does not segment, so both are only reported for digits
+        "digits_per_image": float(np.mean(kept_digits)) if kept_digits else None,
+        # share of photos segmented into as many digits as the sail number has
+        "segmentation_accuracy": float(np.mean(segmented)) if segmented else None,
+        "stages": {stage: summarize(timings[stage]) for stage in stages},
+        "total": {key: summarize(seconds) for key, seconds in totals.items()},
+        "digit_accuracy": {key: float(np.mean(v)) for key, v in accuracy.items()},
+        "number_accuracy": {key: float(np.mean(v)) for key, v in exact.items()},
+    }
+
+
+def environment(recognizer: str) -> dict:
+    """Return the commit and machine the benchmark ran on."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "model": PROVIDERS[recognizer].version,
+    }
+
+
+def compare(previous: dict, current: dict):
+    """Print the changes of the key figures between two benchmark results."""
+    rows = [
+        ("images/s", previous["images_per_second"], current["images_per_second"]),
+        (
+            "p50 ms",
+            previous["total"]["all"]["p50_ms"],
+            current["total"]["all"]["p50_ms"],
+        ),
+        (
+            "p95 ms",
+            previous["total"]["all"]["p95_ms"],
+            current["total"]["all"]["p95_ms"],
+        ),
+        (
+            "p99 ms",
+            previous["total"]["all"]["p99_ms"],
+            current["total"]["all"]["p99_ms"],
+        ),
+        (
+            "digit accuracy",
+            previous["digit_accuracy"]["all"],
+            current["digit_accuracy"]["all"],
+        ),
+        (
+            "number accuracy",
+            previous["number_accuracy"]["all"],
+            current["number_accuracy"]["all"],
+        ),
+    ]
+    if previous["segmentation_accuracy"] and current["segmentation_accuracy"]:
+        rows.append(
+            (
+                "segmentation accuracy",
+                previous["segmentation_accuracy"],
+                current["segmentation_accuracy"],
+            )
+        )
+    for stage in current["stages"]:
+        if stage not in previous["stages"]:
+            continue
+        rows.append(
+            (
+                f"{stage} p50 ms",
+                previous["stages"][stage]["p50_ms"],
+                current["stages"][stage]["p50_ms"],
+            )
+        )
+
+    print(
+        f"{'':40} {previous.get('recognizer', 'digits'):>10} "
+        f"{current['recognizer']:>10} {'change':>8}"
+    )
+    for name, before, after in rows:
+        change = (after - before) / before * 100 if before else float("nan")
+        print(f"{name:40} {before:10.3f} {after:10.3f} {change:+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--noise", type=float, default=12.0)
+    parser.add_argument("--blur", type=int, default=2)
+    parser.add_argument("--perspective", type=float, default=0.06)
+    parser.add_argument("--recognizer", choices=tuple(STAGES), default="digits")
+    parser.add_argument("--output", default="bench.json")
+    parser.add_argument("--compare", help="previous result file to compare with")
+    args = parser.parse_args()
+
+    result = run(
+        args.count,
+        args.seed,
+        recognizer=args.recognizer,
+        noise=args.noise,
+        blur=args.blur,
+        perspective=args.perspective,
+    )
+    result["environment"] = environment(args.recognizer)
+
+    with open(args.output, "w") as output:
+        json.dump(result, output, indent=2)
+
+    print(json.dumps({key: result[key] for key in ("images_per_second",)}))
+    print(json.dumps(result["total"]["all"]))
+    print(
+        json.dumps(
+            {
+                "digit_accuracy": result["digit_accuracy"]["all"],
+                "segmentation_accuracy": result["segmentation_accuracy"],
+            }
+        )
+    )
+
+    if args.compare:
+        with open(args.compare) as previous:
+            compare(json.load(previous), result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""Replay captured traffic against a running app and report its latencies per route.
+
+Capture the traffic by setting ``CAPTURE_DIRECTORY`` on the served app, seed a
+database with the referenced competitions and races, start the app on it and
+replay the capture from the repository root, e.g.::
+
+    python -m benchmarks.seed capture/
+    python -m benchmarks.replay capture/ --target http://localhost:8000 --speed 2
+    python -m benchmarks.replay capture/ --compare replay.json --output new.json
+
+Requests are sent at their captured offsets divided by ``--speed``, whatever
+the responses take, and their latency is measured from the time they were due,
+so a slow app is not hidden by the replay falling behind.
+"""
+import argparse
+import glob
+import http.client
+import json
+import os
+import threading
+import time
+import urllib.parse
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+
+def read_records(paths: List[str]) -> List[dict]:
+    """Return the captured requests of the log files or directories in order.
+
+    The logs of several processes are merged on the time the requests started.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "capture-*.jsonl"))))
+        else:
+            files.append(path)
+
+    records = []
+    for file in files:
+        directory = os.path.dirname(os.path.abspath(file))
+        with open(file) as log:
+            for line in log:
+                if line.strip():
+                    record = json.loads(line)
+                    record["directory"] = directory
+                    records.append(record)
+
+    records.sort(key=lambda record: record["timestamp"])
+    if records:
+        started = records[0]["timestamp"]
+        for record in records:
+            record["offset"] = record["timestamp"] - started
+
+    return records
+
+
+def route_of(record: dict) -> str:
+    """Return the method and route template a request is reported under."""
+    return f"{record['method']} {record['route'] or record['path']}"
+
+
+def load_payload(record: dict) -> Optional[bytes]:
+    """Return the captured body of a request, ``None`` if it was not kept."""
+    if not record["request_bytes"]:
+        return b""
+    if not record["payload"]:
+        return None
+
+    with open(
+        os.path.join(record["directory"], "payloads", record["payload"]), "rb"
+    ) as f:
+        return f.read()
+
+
+class Replayer:
+    """Send the captured requests to the target at their scaled offsets."""
+
+    def __init__(self, target: str, speed: float, concurrency: int, timeout: float):
+        url = urllib.parse.urlsplit(target)
+        self.scheme = url.scheme
+        self.netloc = url.netloc
+        self.speed = speed
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(concurrency, thread_name_prefix="replay")
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.results: List[dict] = []
+        self.skipped = Counter()
+
+    def connection(self) -> http.client.HTTPConnection:
+        # every thread keeps its connection alive between requests
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection_class = (
+                http.client.HTTPSConnection
+                if self.scheme == "https"
+                else http.client.HTTPConnection
+            )
+            connection = connection_class(self.netloc, timeout=self.timeout)
+            self._local.connection = connection
+        return connection
+
+    def send(self, record: dict, body: bytes, due: float):
+        started = time.perf_counter()
+        url = record["path"] + (f"?{record['query']}" if record["query"] else "")
+        headers = {"Content-Type": record["content_type"]} if body else {}
+
+        status = None
+        try:
+            connection = self.connection()
+            connection.request(record["method"], url, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            self._local.connection.close()
+            self._local.connection = None
+        finished = time.perf_counter()
+
+        with self._lock:
+            self.results.append(
+                {
+                    "route": route_of(record),
+                    "status": status,
+                    "captured_status": record["status"],
+                    "captured_ms": record["duration_ms"],
+                    # from the time the request was due, including any queueing
+                    "latency_ms": (finished - due) * 1000,
+                    # from the time the request was actually sent
+                    "service_ms": (finished - started) * 1000,
+                }
+            )
+
+    def replay(self, records: Iterator[dict]) -> float:
+        """Replay the requests and return the seconds it took."""
+        start = time.perf_counter()
+        for record in records:
+            body = load_payload(record)
+            if body is None:
+                self.skipped[route_of(record)] += 1
+                continue
+
+            due = start + record["offset"] / self.speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self.executor.submit(self.send, record, body, due)
+
+        self.executor.shutdown(wait=True)
+        return time.perf_counter() - start
+
+
+def summarize(milliseconds: List[float]) -> Dict[str, float]:
+    """Return the latency percentiles in milliseconds."""
+    milliseconds = np.asarray(milliseconds)
+    return {
+        "p50_ms": float(np.percentile(milliseconds, 50)),
+        "p95_ms": float(np.percentile(milliseconds, 95)),
+        "p99_ms": float(np.percentile(milliseconds, 99)),
+        "max_ms": float(milliseconds.max()),
+    }
+
+
+def report(results: List[dict], skipped: Counter, elapsed: float, speed: float) -> dict:
+    """Return the latency distributions and statuses of the replay per route."""
+    by_route = defaultdict(list)
+    for result in results:
+        by_route[result["route"]].append(result)
+        by_route["all"].append(result)
+
+    routes = {}
+    for route, route_results in sorted(by_route.items()):
+        routes[route] = {
+            "requests": len(route_results),
+            "statuses": dict(Counter(str(r["status"]) for r in route_results)),
+            # responses with another status than the captured one
+            "mismatched": sum(
+                r["status"] != r["captured_status"] for r in route_results
+            ),
+            "latency": summarize([r["latency_ms"] for r in route_results]),
+            "service": summarize([r["service_ms"] for r in route_results]),
+            "captured": summarize([r["captured_ms"] for r in route_results]),
+        }
+
+    return {
+        "speed": speed,
+        "requests": len(results),
+        "seconds": elapsed,
+        "requests_per_second": len(results) / elapsed if elapsed else None,
+        "skipped": dict(skipped),
+        "routes": routes,
+    }
+
+
+def print_report(result: dict):
+    print(
+        f"{'':40} {'requests':>8} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} "
+        f"{'p99 ms':>9} {'max ms':>9} {'captured p95':>12}"
+    )
+    for route, stats in result["routes"].items():
+        errors = sum(
+            count
+            for status, count in stats["statuses"].items()
+            if status == "None" or int(status) >= 500
+        )
+        latency = stats["latency"]
+        print(
+            f"{route:40} {stats['requests']:8} {errors:6} {latency['p50_ms']:9.1f} "
+            f"{latency['p95_ms']:9.1f} {latency['p99_ms']:9.1f} "
+            f"{latency['max_ms']:9.1f} {stats['captured']['p95_ms']:12.1f}"
+        )
+    for route, count in result["skipped"].items():
+        print(f"skipped {count} requests to {route}, their payload was not captured")
+
+
+def compare(previous: dict, current: dict):
+    """Print the changes of the latencies per route between two replays."""
+    print(f"{'':50} {'before':>10} {'after':>10} {'change':>8}")
+    for route, stats in current["routes"].items():
+        if route not in previous["routes"]:
+            continue
+        for percentile in ("p50_ms", "p95_ms", "p99_ms"):
+            before = previous["routes"][route]["latency"][percentile]
+            after = stats["latency"][percentile]
+            change = (after - before) / before * 100 if before else float("nan")
+            name = f"{route} {percentile[:-3]}"
+            print(f"{name:50} {before:10.1f} {after:10.1f} {change:+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("captures", nargs="+", help="capture logs or directories")
+    parser.add_argument("--target", default="http://localhost:8000")
+    parser.add_argument(
+        "--speed", type=float, default=1.0, help="rate relative to the captured one"
+    )
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--output", default="replay.json")
+    parser.add_argument("--compare", help="previous result file to compare with")
+    args = parser.parse_args()
+
+    records = read_records(args.captures)
+    replayer = Replayer(args.target, args.speed, args.concurrency, args.timeout)
+    elapsed = replayer.replay(iter(records))
+
+    result = report(replayer.results, replayer.skipped, elapsed, args.speed)
+    with open(args.output, "w") as output:
+        json.dump(result, output, indent=2)
+
+    print_report(result)
+    if args.compare:
+        with open(args.compare) as previous:
+            compare(json.load(previous), result)
+
+
+if __name__ == "__main__":
+    main()
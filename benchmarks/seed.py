@@ -0,0 +1,165 @@
+"""Seed the database with the competitions and races a traffic capture refers to.
+
+Run from the repository root against the database the replayed app uses, e.g.::
+
+    python -m benchmarks.seed capture/ --fleet 60 --reset
+
+Every competition, race and competitor id found in the captured paths and
+queries is created with that id, each competition with the same fleet of
+competitors, so replays of the capture always start from the same state.
+"""
+import argparse
+import datetime
+import re
+import urllib.parse
+import uuid
+from typing import Dict, List, Set
+
+from sqlalchemy.orm import Session
+
+from api.database import SessionLocal
+from api.models import Boat, Club, Competition, Competitor, Country, Race
+from api.services import next_race_nr, refresh_leaderboard
+from benchmarks.replay import read_records
+
+# first sail number of the seeded fleet
+FIRST_SAIL_NR = 100
+# the kind of id referenced by the path segment before it or the query parameter
+PATH_KINDS = {
+    "competitions": "competition",
+    "races": "race",
+    "competitors": "competitor",
+    "stream": "race",
+}
+QUERY_KINDS = {"competition_id": "competition", "race_id": "race"}
+
+UUID_PATTERN = re.compile(
+    r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$"
+)
+
+
+def find_ids(records: List[dict]) -> Dict[str, Set[uuid.UUID]]:
+    """Return the competition, race and competitor ids referenced by requests."""
+    ids = {"competition": set(), "race": set(), "competitor": set()}
+    for record in records:
+        segments = record["path"].strip("/").split("/")
+        for previous, segment in zip(segments, segments[1:]):
+            if previous in PATH_KINDS and UUID_PATTERN.match(segment):
+                ids[PATH_KINDS[previous]].add(uuid.UUID(segment))
+
+        for name, value in urllib.parse.parse_qsl(record["query"]):
+            if name in QUERY_KINDS and UUID_PATTERN.match(value):
+                ids[QUERY_KINDS[name]].add(uuid.UUID(value))
+
+    return ids
+
+
+def add_competition(db: Session, id: uuid.UUID, fleet: int):
+    """Add a competition with a fleet of ``fleet`` competitors."""
+    today = datetime.date.today()
+    db.add(
+        Competition(
+            id=id,
+            title=f"replay {str(id)[:8]}",
+            boat=Boat.ILCA_7,
+            start_date=today,
+            end_date=today + datetime.timedelta(days=7),
+        )
+    )
+    db.flush()
+
+    for i in range(fleet):
+        add_competitor(db, id, i)
+
+
+def add_competitor(db: Session, competition_id: uuid.UUID, i: int, id=None):
+    """Add the ``i``-th competitor of the seeded fleet to a competition."""
+    db.add(
+        Competitor(
+            id=id,
+            first_name=f"Sailor {i + 1}",
+            last_name="Replay",
+            country=list(Country)[i % len(Country)],
+            club=list(Club)[i % len(Club)],
+            sail_nr=FIRST_SAIL_NR + i,
+            competition_id=competition_id,
+        )
+    )
+
+
+def seed(records: List[dict], fleet: int, reset: bool):
+    """Create the referenced ids that do not exist yet, recreating all of them
+    with ``reset``.
+
+    Races and competitors join the first referenced competition, a fixed one if
+    the capture references none.
+    """
+    ids = find_ids(records)
+    if not ids["competition"] and (ids["race"] or ids["competitor"]):
+        ids["competition"].add(uuid.uuid5(uuid.NAMESPACE_URL, "replay"))
+    competitions = sorted(ids["competition"])
+    models = {"competition": Competition, "race": Race, "competitor": Competitor}
+
+    db: Session = SessionLocal()
+    try:
+        if reset:
+            for kind in ("competitor", "race", "competition"):
+                model = models[kind]
+                for instance in db.query(model).filter(model.id.in_(ids[kind])):
+                    db.delete(instance)
+            db.flush()
+
+        existing = {
+            kind: {id for id, in db.query(model.id).filter(model.id.in_(ids[kind]))}
+            for kind, model in models.items()
+        }
+
+        for id in competitions:
+            if id not in existing["competition"]:
+                add_competition(db, id, fleet)
+
+        # numbered like created races, so replayed ones get the next numbers
+        for id in sorted(ids["race"] - existing["race"]):
+            race_nr = next_race_nr(db, competitions[0])
+            db.add(Race(id=id, race_nr=race_nr, competition_id=competitions[0]))
+
+        # referenced competitors follow the fleet of the first competition
+        fleet_size = (
+            db.query(Competitor)
+            .filter(Competitor.competition_id == competitions[0])
+            .count()
+            if competitions
+            else 0
+        )
+        new_competitors = sorted(ids["competitor"] - existing["competitor"])
+        for i, id in enumerate(new_competitors, start=fleet_size):
+            add_competitor(db, competitions[0], i, id)
+
+        # replayed result requests read the standings of the seeded fleets
+        db.flush()
+        for id in competitions:
+            refresh_leaderboard(db, id)
+        db.commit()
+    finally:
+        db.close()
+
+    print(
+        f"seeded {len(ids['competition'])} competitions, {len(ids['race'])} races "
+        f"and {len(ids['competitor'])} referenced competitors"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("captures", nargs="+", help="capture logs or directories")
+    parser.add_argument("--fleet", type=int, default=60)
+    parser.add_argument(
+        "--reset", action="store_true", help="recreate the referenced ids first"
+    )
+    args = parser.parse_args()
+
+    seed(read_records(args.captures), args.fleet, args.reset)
+
+
+if __name__ == "__main__":
+    main()
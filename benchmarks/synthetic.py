@@ -0,0 +1,84 @@
+from typing import Iterator, NamedTuple, Tuple
+
+import cv2
+import numpy as np
+
+# fonts the sail numbers are rendered with
+FONTS = (cv2.FONT_HERSHEY_SIMPLEX, cv2.FONT_HERSHEY_DUPLEX)
+
+
+class SyntheticImage(NamedTuple):
+    """Representing a rendered sail number photo and its ground truth."""
+
+    number: str
+    resolution: Tuple[int, int]
+    contents: bytes
+
+
+def render_sail_number(
+    number: str,
+    resolution: Tuple[int, int],
+    rng: np.random.Generator,
+    noise: float = 12.0,
+    blur: int = 2,
+    perspective: float = 0.06,
+) -> np.ndarray:
+    """Render a sail number as dark digits on a light sail.
+
+    The rendering is distorted by a random perspective warp of up to the given
+    fraction of the image size, a gaussian blur and additive gaussian noise.
+    """
+    width, height = resolution
+    image = np.full((height, width, 3), rng.integers(170, 240), dtype=np.uint8)
+
+    font = FONTS[rng.integers(len(FONTS))]
+    thickness = max(2, width // 60)
+    scale = 1.0
+    (text_width, text_height), _ = cv2.getTextSize(number, font, scale, thickness)
+    scale = 0.7 * width / text_width
+    thickness = max(2, int(thickness * scale / 2))
+    (text_width, text_height), _ = cv2.getTextSize(number, font, scale, thickness)
+
+    origin = (
+        int((width - text_width) / 2 + rng.uniform(-0.05, 0.05) * width),
+        int((height + text_height) / 2 + rng.uniform(-0.05, 0.05) * height),
+    )
+    color = tuple(int(c) for c in rng.integers(0, 60, size=3))
+    cv2.putText(image, number, origin, font, scale, color, thickness, cv2.LINE_AA)
+
+    if perspective > 0:
+        corners = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+        jitter = rng.uniform(-perspective, perspective, size=(4, 2)) * [width, height]
+        matrix = cv2.getPerspectiveTransform(corners, np.float32(corners + jitter))
+        image = cv2.warpPerspective(
+            image, matrix, (width, height), borderMode=cv2.BORDER_REPLICATE
+        )
+
+    if blur > 0:
+        kernel = 2 * int(rng.integers(0, blur + 1)) + 1
+        image = cv2.GaussianBlur(image, (kernel, kernel), 0)
+
+    if noise > 0:
+        image = np.clip(image + rng.normal(0, noise, image.shape), 0, 255)
+
+    return image.astype(np.uint8)
+
+
+def generate_images(
+    count: int,
+    resolutions: Tuple[Tuple[int, int], ...],
+    seed: int = 0,
+    **distortions,
+) -> Iterator[SyntheticImage]:
+    """Yield jpeg encoded sail number photos with known ground truth."""
+    rng = np.random.default_rng(seed)
+
+    for i in range(count):
+        resolution = resolutions[i % len(resolutions)]
+        number = str(rng.integers(1, 10)) + "".join(
+            str(digit) for digit in rng.integers(0, 10, size=rng.integers(1, 6))
+        )
+        image = render_sail_number(number, resolution, rng, **distortions)
+        _, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+
+        yield SyntheticImage(number, resolution, encoded.tobytes())
@@ -1,8 +1,12 @@
 import uvicorn
 
 from api import create_app, settings
+from api.server import serve
 
 app = create_app()
 
 if __name__ == "__main__":
-    uvicorn.run(app=app, host=settings.fastapi_app, port=settings.fastapi_port)
+    if settings.server_workers > 1:
+        serve(app, settings.server_workers)
+    else:
+        uvicorn.run(app=app, host=settings.fastapi_app, port=settings.fastapi_port)
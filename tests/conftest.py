@@ -0,0 +1,14 @@
+import os
+
+# the settings require the app and database configuration, the unit tests
+# import the services but never connect to the database
+for name, value in {
+    "FASTAPI_APP": "0.0.0.0",
+    "FASTAPI_PORT": "8080",
+    "DATABASE_HOSTNAME": "localhost",
+    "DATABASE_PORT": "5432",
+    "DATABASE_PASSWORD": "postgres",
+    "DATABASE_NAME": "sailing",
+    "DATABASE_USERNAME": "postgres",
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from api.admission import CLIENT_LIMIT, QUEUE_FULL, AdmissionQueue, Overloaded
+
+
+async def hold(queue, client, started, release, name):
+    async with queue.admit(client):
+        started.append(name)
+        await release.wait()
+
+
+def test_requests_beyond_the_concurrency_wait_in_arrival_order():
+    async def run():
+        queue = AdmissionQueue("test", concurrency=2, depth=5, per_client=0)
+        started, release = [], asyncio.Event()
+        tasks = [
+            asyncio.create_task(hold(queue, f"client-{i}", started, release, i))
+            for i in range(5)
+        ]
+        await asyncio.sleep(0)
+
+        assert started == [0, 1]
+        assert (queue.active, queue.waiting) == (2, 3)
+
+        release.set()
+        await asyncio.gather(*tasks)
+
+        assert started == [0, 1, 2, 3, 4]
+        assert (queue.active, queue.waiting) == (0, 0)
+
+    asyncio.run(run())
+
+
+def test_requests_beyond_the_depth_are_rejected():
+    async def run():
+        queue = AdmissionQueue("test", concurrency=1, depth=1, per_client=0)
+        started, release = [], asyncio.Event()
+        tasks = [
+            asyncio.create_task(hold(queue, f"client-{i}", started, release, i))
+            for i in range(2)
+        ]
+        await asyncio.sleep(0)
+
+        with pytest.raises(Overloaded) as rejected:
+            async with queue.admit("client-2"):
+                pass
+        assert rejected.value.reason == QUEUE_FULL
+        assert rejected.value.retry_after >= 1
+
+        release.set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+
+
+def test_requests_beyond_the_client_limit_are_rejected():
+    async def run():
+        queue = AdmissionQueue("test", concurrency=4, depth=4, per_client=1)
+        started, release = [], asyncio.Event()
+        task = asyncio.create_task(hold(queue, "client", started, release, 0))
+        await asyncio.sleep(0)
+
+        with pytest.raises(Overloaded) as rejected:
+            queue.check("client")
+        assert rejected.value.reason == CLIENT_LIMIT
+        queue.check("other-client")
+
+        release.set()
+        await task
+        queue.check("client")
+
+    asyncio.run(run())
+
+
+def test_cancelled_waiters_give_up_their_place():
+    async def run():
+        queue = AdmissionQueue("test", concurrency=1, depth=5, per_client=0)
+        started, release = [], asyncio.Event()
+        first = asyncio.create_task(hold(queue, "a", started, release, "a"))
+        waiting = asyncio.create_task(hold(queue, "b", started, release, "b"))
+        last = asyncio.create_task(hold(queue, "c", started, release, "c"))
+        await asyncio.sleep(0)
+
+        waiting.cancel()
+        await asyncio.sleep(0)
+        assert queue.waiting == 1
+
+        release.set()
+        await asyncio.gather(first, last)
+
+        assert started == ["a", "c"]
+        assert (queue.active, queue.waiting) == (0, 0)
+
+    asyncio.run(run())
+
+
+def test_slot_handed_to_a_cancelled_waiter_is_passed_on():
+    async def run():
+        queue = AdmissionQueue("test", concurrency=1, depth=5, per_client=0)
+        started, release = [], asyncio.Event()
+        first = queue.admit("a")
+        await first.__aenter__()
+        waiting = asyncio.create_task(hold(queue, "b", started, release, "b"))
+        last = asyncio.create_task(hold(queue, "c", started, release, "c"))
+        await asyncio.sleep(0)
+
+        # the slot is handed to b, which is cancelled before it gets to run
+        await first.__aexit__(None, None, None)
+        waiting.cancel()
+        release.set()
+        await asyncio.wait_for(
+            asyncio.gather(waiting, last, return_exceptions=True), timeout=1
+        )
+
+        assert started == ["c"]
+        assert (queue.active, queue.waiting) == (0, 0)
+
+    asyncio.run(run())
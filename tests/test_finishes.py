@@ -0,0 +1,34 @@
+import pytest
+
+from api.services.finishes import parse_finish_order
+
+
+@pytest.mark.parametrize(
+    "contents, sail_nrs",
+    [
+        (b"12\n7\n301\n", [12, 7, 301]),
+        (b"12,Alice\r\n7,Bob\r\n", [12, 7]),
+        (b"name,Sail_Nr\nAlice, 12\nBob,7\n", [12, 7]),
+        (b"sail number\n12\n7\n", [12, 7]),
+        (b"\xef\xbb\xbfsail_nr\n12\n7\n", [12, 7]),
+        (b"\xef\xbb\xbf12\n7\n", [12, 7]),
+        (b"\n12\n,\n \n7\n\n", [12, 7]),
+        (b"", []),
+        (b"sail_nr\n", []),
+    ],
+)
+def test_sail_numbers_are_read_in_order(contents, sail_nrs):
+    assert parse_finish_order(contents) == sail_nrs
+
+
+@pytest.mark.parametrize(
+    "contents, message",
+    [
+        (b"12\nDNF\n7\n", "row 2 has no sail number: DNF"),
+        (b"name,sail_nr\nAlice,12\nBob\n", "row 2 has no sail number: Bob"),
+        (b"12\n-7\n", "row 2 has no sail number: -7"),
+    ],
+)
+def test_rows_without_a_sail_number_are_rejected(contents, message):
+    with pytest.raises(ValueError, match=message):
+        parse_finish_order(contents)
@@ -0,0 +1,87 @@
+import cv2
+import numpy as np
+import pytest
+
+from api.services.position import (
+    DIGIT_SIZE,
+    decode_image,
+    get_jpeg_size,
+    seperate_number_into_digits,
+)
+
+
+def crop_and_resize(image, digit_boxes):
+    """Return the digits as cut out before the batch was built at once."""
+    return np.array(
+        [
+            cv2.resize(
+                image[y0:y1, x0:x1],
+                (DIGIT_SIZE, DIGIT_SIZE),
+                interpolation=cv2.INTER_AREA,
+            )
+            for x0, y0, x1, y1 in digit_boxes
+        ]
+    )
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_seperate_number_into_digits_matches_crop_and_resize(seed):
+    rng = np.random.default_rng(seed)
+    image = cv2.GaussianBlur(
+        rng.integers(0, 256, (400, 400), dtype=np.uint8), (5, 5), 0
+    )
+    # integer, fractional, upscaling and edge touching scales
+    x0, y0 = rng.integers(0, 300, 2)
+    digit_boxes = np.array(
+        [
+            [x0, y0, x0 + 84, y0 + 84],
+            [x0, y0, x0 + 37, y0 + 81],
+            [5, 7, 20, 30],
+            [300, 100, 400, 400],
+        ]
+    )
+
+    digits = seperate_number_into_digits(image, digit_boxes)
+
+    assert digits.dtype == np.uint8
+    np.testing.assert_array_equal(digits, crop_and_resize(image, digit_boxes))
+
+
+def test_seperate_number_into_digits_without_boxes():
+    image = np.zeros((400, 400), dtype=np.uint8)
+
+    digits = seperate_number_into_digits(image, np.empty((0, 4), dtype=np.int64))
+
+    assert digits.shape == (0, DIGIT_SIZE, DIGIT_SIZE)
+
+
+@pytest.mark.parametrize("progressive", [0, 1])
+@pytest.mark.parametrize("width, height", [(640, 480), (401, 3000), (16, 16)])
+def test_get_jpeg_size(width, height, progressive):
+    image = np.full((height, width, 3), 128, dtype=np.uint8)
+    _, jpeg = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_PROGRESSIVE, progressive])
+
+    assert get_jpeg_size(jpeg.tobytes()) == (width, height)
+
+
+def test_get_jpeg_size_of_other_data():
+    _, png = cv2.imencode(".png", np.zeros((10, 10), dtype=np.uint8))
+
+    assert get_jpeg_size(png.tobytes()) is None
+    assert get_jpeg_size(b"") is None
+    # cut off before the frame header
+    assert get_jpeg_size(b"\xff\xd8\xff\xe0\x00\x10JFIF") is None
+
+
+@pytest.mark.parametrize(
+    "width, height, decoded",
+    [(3200, 2400, (800, 600)), (1000, 800, (500, 400)), (600, 450, (600, 450))],
+)
+def test_decode_image_reduces_large_images(width, height, decoded):
+    image = np.full((height, width, 3), 200, dtype=np.uint8)
+    _, jpeg = cv2.imencode(".jpg", image)
+
+    gray = decode_image(jpeg.tobytes())
+
+    assert gray.ndim == 2
+    assert gray.shape[::-1] == decoded
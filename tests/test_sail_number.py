@@ -0,0 +1,47 @@
+import random
+
+import pytest
+
+from api.services.sail_number import BKTree, edit_distance
+
+
+@pytest.mark.parametrize(
+    "a, b, distance",
+    [
+        ("", "", 0),
+        ("", "123", 3),
+        ("123", "123", 0),
+        ("123", "124", 1),
+        ("123", "1234", 1),
+        ("1234", "124", 1),
+        ("1234", "2143", 3),
+        ("kitten", "sitting", 3),
+    ],
+)
+def test_edit_distance(a, b, distance):
+    assert edit_distance(a, b) == distance
+    assert edit_distance(b, a) == distance
+
+
+def test_bk_tree_search_finds_the_same_words_as_a_full_scan():
+    rng = random.Random(0)
+    words = {str(rng.randint(1, 99999)) for _ in range(500)}
+    tree = BKTree(words)
+
+    for _ in range(50):
+        query = str(rng.randint(1, 99999))
+        distances = sorted((edit_distance(query, word), word) for word in words)
+        for max_distance in (0, 1, 2):
+            expected = [match for match in distances if match[0] <= max_distance]
+            assert tree.search(query, max_distance) == expected
+
+
+def test_bk_tree_ignores_repeated_words():
+    tree = BKTree(["123", "123", "124"])
+
+    assert len(tree) == 2
+    assert tree.search("123", 0) == [(0, "123")]
+
+
+def test_empty_bk_tree():
+    assert BKTree().search("123", 2) == []
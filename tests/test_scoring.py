@@ -0,0 +1,86 @@
+import random
+
+import pytest
+
+from api.models import Competitor
+from api.services.scoring import add_points, discard_count
+
+
+def reference_score(results, discards):
+    """Return the total and net points and the discarded results, like
+    ``RESCORE_COMPETITION`` computes them from the positions."""
+    discarded = sorted(results, reverse=True)[:discards]
+    return sum(results), sum(results) - sum(discarded), sorted(discarded)
+
+
+def rescore(competitor, results, discards):
+    total, net, discarded = reference_score(results, discards)
+    competitor.total_points = total
+    competitor.net_points = net
+    competitor.discarded_points = discarded
+
+
+def assert_scored(competitor, results, discards):
+    total, net, discarded = reference_score(results, discards)
+    assert competitor.total_points == total
+    assert competitor.net_points == net
+    assert sorted(competitor.discarded_points) == discarded
+
+
+def new_competitor():
+    return Competitor(total_points=0, net_points=0, discarded_points=[])
+
+
+@pytest.mark.parametrize(
+    "results, discards, net, discarded",
+    [
+        ([3, 1, 2], 0, 6, []),
+        ([3, 1, 2, 5], 1, 6, [5]),
+        ([5, 1, 2, 3], 1, 6, [5]),
+        ([1, 4, 4, 2, 6, 3, 4, 1], 2, 15, [4, 6]),
+        ([2], 2, 0, [2]),
+    ],
+)
+def test_worst_results_are_discarded(results, discards, net, discarded):
+    competitor = new_competitor()
+
+    for points in results:
+        add_points(competitor, points, discards)
+
+    assert competitor.total_points == sum(results)
+    assert competitor.net_points == net
+    assert sorted(competitor.discarded_points) == discarded
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_finishes_match_a_rescore(seed):
+    rng = random.Random(seed)
+    fleet = rng.randint(1, 12)
+    competitors = [new_competitor() for _ in range(fleet)]
+    results = [[] for _ in range(fleet)]
+    races = []
+
+    for _ in range(200):
+        if not races or rng.random() < 0.15:
+            races.append([])
+            # like creating a race, every few races one more result is discarded
+            # and all competitors are rescored
+            if discard_count(len(races)) != discard_count(len(races) - 1):
+                for competitor, points in zip(competitors, results):
+                    rescore(competitor, points, discard_count(len(races)))
+            continue
+
+        # a finish of a boat that did not finish the race yet, in any race
+        race = rng.choice(races)
+        remaining = [i for i in range(fleet) if i not in race]
+        if not remaining:
+            continue
+        i = rng.choice(remaining)
+        race.append(i)
+        points = len(race)
+
+        add_points(competitors[i], points, discard_count(len(races)))
+        results[i].append(points)
+
+        for competitor, points in zip(competitors, results):
+            assert_scored(competitor, points, discard_count(len(races)))
@@ -0,0 +1,52 @@
+import itertools
+
+import numpy as np
+
+from api.services.sequence import BLANK, ctc_greedy_decode
+
+
+def one_hot(classes):
+    probabilities = np.full((len(classes), BLANK + 1), 0.01, dtype=np.float32)
+    probabilities[np.arange(len(classes)), classes] = 0.9
+    return probabilities
+
+
+def reference_decode(classes):
+    return "".join(str(c) for c, _ in itertools.groupby(classes) if c != BLANK)
+
+
+def test_repeats_are_merged_and_blanks_dropped():
+    b = BLANK
+    sequences = [
+        [1, 1, b, 2, 2, 2, b, b, 3],
+        [7, b, 7, 7, b, 0, b, b, b],
+        [b, b, b, b, b, b, b, b, b],
+        [4, 4, 4, 4, 4, 4, 4, 4, 4],
+    ]
+
+    decoded = ctc_greedy_decode(np.stack([one_hot(s) for s in sequences]))
+
+    assert [number for number, _ in decoded] == ["123", "770", "", "4"]
+
+
+def test_digit_probabilities_of_the_emitting_steps():
+    probabilities = one_hot([5, 5, BLANK, 8])[None]
+
+    ((number, digits),) = ctc_greedy_decode(probabilities)
+
+    assert number == "58"
+    assert digits.shape == (2, BLANK)
+    np.testing.assert_array_equal(digits, probabilities[0, [0, 3], :BLANK])
+
+
+def test_matches_a_reference_decoder():
+    rng = np.random.default_rng(0)
+    probabilities = rng.random((64, 32, BLANK + 1)).astype(np.float32)
+    # long runs of the same class as a real model emits them
+    probabilities = np.repeat(probabilities[:, ::4], 4, axis=1)
+
+    decoded = ctc_greedy_decode(probabilities)
+
+    for (number, digits), sequence in zip(decoded, probabilities):
+        assert number == reference_decode(sequence.argmax(-1))
+        assert len(digits) == len(number)
@@ -0,0 +1,48 @@
+from api.services.stream import FinishDetector
+
+
+def observe(detector, sail_nrs):
+    return [detector.observe(sail_nr) for sail_nr in sail_nrs]
+
+
+def test_finish_is_confirmed_after_consecutive_frames():
+    detector = FinishDetector(confirm_frames=3)
+
+    assert observe(detector, [7, 7, 7, 7]) == [False, False, True, False]
+    assert detector.confirmed == {7}
+
+
+def test_other_or_missing_sail_numbers_restart_the_streak():
+    detector = FinishDetector(confirm_frames=3)
+
+    assert observe(detector, [7, 7, 8, 7, 7, None, 7, 7, 7]) == [
+        False,
+        False,
+        False,
+        False,
+        False,
+        False,
+        False,
+        False,
+        True,
+    ]
+
+
+def test_finish_is_only_reported_once_per_stream():
+    detector = FinishDetector(confirm_frames=2)
+
+    assert observe(detector, [7, 7, 8, 8, 7, 7]) == [
+        False,
+        True,
+        False,
+        True,
+        False,
+        False,
+    ]
+    assert detector.confirmed == {7, 8}
+
+
+def test_single_frame_confirmation():
+    detector = FinishDetector(confirm_frames=1)
+
+    assert observe(detector, [None, 5, 5, 6]) == [False, True, False, True]
@@ -0,0 +1,18 @@
+import signal
+import threading
+
+from api import settings
+from api.services.jobs import start_workers
+
+if __name__ == "__main__":
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    workers = start_workers(max(settings.job_workers, 1), stop)
+
+    # let running jobs finish before exiting
+    while not stop.wait(1):
+        pass
+    for worker in workers:
+        worker.join()